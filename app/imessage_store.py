@@ -1,31 +1,120 @@
+import base64
+import json
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
 DB_PATH = Path(__file__).resolve().parent.parent / "data" / "processed.db"
 
-def connect():
-    if not DB_PATH.exists():
-        raise FileNotFoundError("data/processed.db not found. Run: make imessage")
-    con = sqlite3.connect(str(DB_PATH))
+# Read-only connection pool shared by the API worker threads. Reusing
+# connections keeps SQLite's page cache and each connection's prepared
+# statement cache warm between requests.
+POOL_SIZE = 8
+MMAP_SIZE = 256 * 1024 * 1024    # bytes
+CACHE_SIZE_KIB = 64 * 1024       # per connection
+STATEMENT_CACHE_SIZE = 256
+
+def _open_readonly():
+    con = sqlite3.connect(
+        f"{DB_PATH.as_uri()}?mode=ro",
+        uri=True,
+        check_same_thread=False,  # handed between threads, used by one at a time
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
     con.row_factory = sqlite3.Row
+    con.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    con.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    con.execute("PRAGMA temp_store=MEMORY")
     return con
 
+class _ConnectionPool:
+    """
+    LIFO pool of read-only connections to DB_PATH.
+
+    Connections are tagged with the (device, inode) of the file they were
+    opened on. When processed.db is replaced (e.g. by a re-import) idle
+    connections are dropped and borrowed ones are closed on release, so
+    readers move over to the new file.
+    """
+
+    def __init__(self, size: int):
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._file_id = None
+
+    def _current_file_id(self):
+        try:
+            st = os.stat(DB_PATH)
+        except FileNotFoundError:
+            raise FileNotFoundError("data/processed.db not found. Run: make imessage")
+        file_id = (st.st_dev, st.st_ino)
+        with self._lock:
+            if file_id != self._file_id:
+                self._file_id = file_id
+                self._close_idle()
+        return file_id
+
+    def _close_idle(self):
+        while True:
+            try:
+                con, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            con.close()
+
+    def acquire(self):
+        file_id = self._current_file_id()
+        while True:
+            try:
+                con, con_file_id = self._idle.get_nowait()
+            except queue.Empty:
+                return _open_readonly(), file_id
+            if con_file_id == file_id:
+                return con, file_id
+            con.close()
+
+    def release(self, con, file_id):
+        if file_id != self._file_id:
+            con.close()
+            return
+        try:
+            self._idle.put_nowait((con, file_id))
+        except queue.Full:
+            con.close()
+
+    def close(self):
+        with self._lock:
+            self._close_idle()
+            self._file_id = None
+
+_pool = _ConnectionPool(POOL_SIZE)
+
+@contextmanager
+def connection():
+    """Borrow a pooled read-only connection for the duration of a `with` block."""
+    con, file_id = _pool.acquire()
+    try:
+        yield con
+    finally:
+        _pool.release(con, file_id)
+
 def list_threads(limit=50):
-    con = connect()
-    rows = con.execute(
-        "SELECT chat_id, title, last_message_at FROM threads ORDER BY last_message_at DESC LIMIT ?",
-        (limit,)
-    ).fetchall()
-    con.close()
+    with connection() as con:
+        rows = con.execute(
+            "SELECT chat_id, title, last_message_at FROM threads ORDER BY last_message_at DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
     return [dict(r) for r in rows]
 
 def get_messages(chat_id: int, limit=50):
-    con = connect()
-    rows = con.execute(
-        "SELECT sent_at, sender_name, text FROM messages WHERE chat_id=? ORDER BY sent_at DESC LIMIT ?",
-        (chat_id, limit)
-    ).fetchall()
-    con.close()
+    with connection() as con:
+        rows = con.execute(
+            "SELECT sent_at, sender_name, text FROM messages WHERE chat_id=? ORDER BY sent_at DESC LIMIT ?",
+            (chat_id, limit)
+        ).fetchall()
     return [dict(r) for r in rows]
 
 
@@ -34,18 +123,129 @@ def get_messages_in_range(chat_id: int, start_date: str, end_date: str):
     Get messages in a thread within a date range (inclusive).
     start_date, end_date: "YYYY-MM-DD". Times are treated as start of day and end of day.
     """
-    con = connect()
     start_ts = f"{start_date} 00:00:00"
     end_ts = f"{end_date} 23:59:59"
-    rows = con.execute(
-        """SELECT sent_at, sender_name, text FROM messages
-           WHERE chat_id = ? AND sent_at >= ? AND sent_at <= ?
-           ORDER BY sent_at ASC""",
-        (chat_id, start_ts, end_ts),
-    ).fetchall()
-    con.close()
+    with connection() as con:
+        rows = con.execute(
+            """SELECT sent_at, sender_name, text FROM messages
+               WHERE chat_id = ? AND sent_at >= ? AND sent_at <= ?
+               ORDER BY sent_at ASC""",
+            (chat_id, start_ts, end_ts),
+        ).fetchall()
     return [dict(r) for r in rows]
 
+# Context engine: given a `hits` CTE (message_id, chat_id, sent_at, title, ord),
+# return each hit's +/- :n neighbours in a single statement. Neighbours are found
+# with bounded seeks on idx_messages_chat_time, so the cost scales with the
+# number of hits and the window size, never with the size of the thread (the
+# thread's total comes from threads.message_count, maintained by the importer).
+# Messages within a thread are ordered by (sent_at, message_id). CROSS JOIN pins
+# the join order so the planner always drives from the hits.
+_CONTEXT_SQL = """
+    WITH hits AS ({hits}),
+    edges AS (
+        SELECT h.*,
+            COALESCE((
+                SELECT message_id FROM (
+                    SELECT p.message_id, p.sent_at FROM messages p
+                    WHERE p.chat_id = h.chat_id
+                      AND (p.sent_at, p.message_id) < (h.sent_at, h.message_id)
+                    ORDER BY p.sent_at DESC, p.message_id DESC LIMIT :n
+                ) ORDER BY sent_at, message_id LIMIT 1
+            ), h.message_id) AS lo_id,
+            COALESCE((
+                SELECT message_id FROM (
+                    SELECT p.message_id, p.sent_at FROM messages p
+                    WHERE p.chat_id = h.chat_id
+                      AND (p.sent_at, p.message_id) > (h.sent_at, h.message_id)
+                    ORDER BY p.sent_at, p.message_id LIMIT :n
+                ) ORDER BY sent_at DESC, message_id DESC LIMIT 1
+            ), h.message_id) AS hi_id
+        FROM hits h
+    )
+    SELECT e.message_id AS match_id, e.chat_id, e.title, e.ord, e.snippet, t.message_count AS total,
+           c.message_id, c.sent_at, c.sender_name, c.text,
+           ROW_NUMBER() OVER (
+               PARTITION BY e.message_id ORDER BY c.sent_at, c.message_id
+           ) - 1 AS pos,
+           EXISTS (
+               SELECT 1 FROM messages p
+               WHERE p.chat_id = e.chat_id
+                 AND (p.sent_at, p.message_id) < (lo.sent_at, lo.message_id)
+           ) AS has_more_before,
+           EXISTS (
+               SELECT 1 FROM messages p
+               WHERE p.chat_id = e.chat_id
+                 AND (p.sent_at, p.message_id) > (hi.sent_at, hi.message_id)
+           ) AS has_more_after
+    FROM edges e
+    CROSS JOIN messages lo ON lo.message_id = e.lo_id
+    CROSS JOIN messages hi ON hi.message_id = e.hi_id
+    CROSS JOIN threads t ON t.chat_id = e.chat_id
+    CROSS JOIN messages c ON c.chat_id = e.chat_id
+     AND (c.sent_at, c.message_id) >= (lo.sent_at, lo.message_id)
+     AND (c.sent_at, c.message_id) <= (hi.sent_at, hi.message_id)
+    ORDER BY e.ord, pos
+"""
+
+
+def _context_windows(con, hits_sql: str, params: dict, context_size: int):
+    """
+    Run the context engine for the hits selected by `hits_sql`.
+
+    `hits_sql` must select message_id, chat_id, sent_at, title, snippet (may be
+    NULL) and an `ord` column giving the order results are returned in. Named parameters in
+    `params` are passed through; `:n` is reserved for the window size.
+
+    Returns one result dict per hit, in `ord` order.
+    """
+    has_counts = con.execute(
+        "SELECT 1 FROM pragma_table_info('threads') WHERE name = 'message_count'"
+    ).fetchone()
+    if not has_counts:
+        raise ValueError("Thread message counts not found in data/processed.db. Re-run: make imessage")
+    rows = con.execute(
+        _CONTEXT_SQL.format(hits=hits_sql),
+        {**params, "n": max(0, context_size)},
+    )
+
+    results = []
+    current = None
+    for row in rows:
+        if current is None or current['match_message_id'] != row['match_id']:
+            current = {
+                'chat_id': row['chat_id'],
+                'title': row['title'],
+                'match_message_id': row['match_id'],
+                'match_index': None,
+                'messages': [],
+                'has_more_before': bool(row['has_more_before']),
+                'has_more_after': bool(row['has_more_after']),
+                'total_messages_in_thread': row['total']
+            }
+            if row['snippet'] is not None:
+                current['snippet'] = row['snippet']
+            results.append(current)
+
+        is_match = row['message_id'] == row['match_id']
+        if is_match:
+            current['match_index'] = row['pos']
+        current['messages'].append({
+            'message_id': row['message_id'],
+            'sent_at': row['sent_at'],
+            'sender_name': row['sender_name'],
+            'text': row['text'],
+            'is_match': is_match
+        })
+
+    # Paging tokens so clients can load more via get_context_page
+    for result in results:
+        first, last = result['messages'][0], result['messages'][-1]
+        result['before_cursor'] = _encode_cursor(result['chat_id'], first['sent_at'], first['message_id'])
+        result['after_cursor'] = _encode_cursor(result['chat_id'], last['sent_at'], last['message_id'])
+
+    return results
+
 def search_exact(query: str, context_size: int = 2, chat_id: int = None):
     """
     Search for exact keyword matches and return context windows around each match.
@@ -62,92 +262,119 @@ def search_exact(query: str, context_size: int = 2, chat_id: int = None):
         - messages: List of messages in the context window (includes context + match)
         - match_index: Index of the matching message in the messages list
     """
-    con = connect()
-    
     # Find all messages containing the query (case-insensitive)
-    query_pattern = f"%{query}%"
-    
-    # Build SQL query with optional chat_id filter
-    sql = """
-        SELECT m.message_id, m.chat_id, m.sent_at, m.sender_name, m.text, t.title
+    hits_sql = """
+        SELECT m.message_id, m.chat_id, m.sent_at, t.title, NULL AS snippet,
+               ROW_NUMBER() OVER (ORDER BY m.sent_at DESC, m.message_id DESC) AS ord
         FROM messages m
         JOIN threads t ON m.chat_id = t.chat_id
-        WHERE m.text LIKE ? COLLATE NOCASE
+        WHERE m.text LIKE :pattern COLLATE NOCASE
     """
-    params = [query_pattern]
+    params = {'pattern': f"%{query}%"}
     
     if chat_id is not None:
-        sql += " AND m.chat_id = ?"
-        params.append(chat_id)
-    
-    sql += " ORDER BY m.sent_at DESC"
-    
-    matches = con.execute(sql, params).fetchall()
+        hits_sql += " AND m.chat_id = :chat_id"
+        params['chat_id'] = chat_id
     
-    results = []
-    
-    for match in matches:
-        match_id = match['message_id']
-        chat_id = match['chat_id']
-        match_time = match['sent_at']
-        title = match['title']
-        
-        # Get context window: messages before and after the match
-        # Get messages in the same chat around the match timestamp
-        context_messages = con.execute(
-            """
-            SELECT message_id, sent_at, sender_name, text,
-                   CASE WHEN message_id = ? THEN 1 ELSE 0 END as is_match
-            FROM messages
-            WHERE chat_id = ?
-            ORDER BY sent_at
-            """,
-            (match_id, chat_id)
-        ).fetchall()
-        
-        # Find the index of the matching message
-        match_index = None
-        for i, msg in enumerate(context_messages):
-            if msg['message_id'] == match_id:
-                match_index = i
-                break
-        
-        if match_index is None:
-            continue
-            
-        # Extract context window
-        start_index = max(0, match_index - context_size)
-        end_index = min(len(context_messages), match_index + context_size + 1)
-        window = context_messages[start_index:end_index]
-        
-        # Format messages
-        messages = []
-        window_match_index = None
-        for i, msg in enumerate(window):
-            messages.append({
-                'message_id': msg['message_id'],
-                'sent_at': msg['sent_at'],
-                'sender_name': msg['sender_name'],
-                'text': msg['text'],
-                'is_match': bool(msg['is_match'])
-            })
-            if msg['is_match']:
-                window_match_index = i
-        
-        results.append({
-            'chat_id': chat_id,
-            'title': title,
-            'match_message_id': match_id,
-            'match_index': window_match_index,
-            'messages': messages,
-            'has_more_before': start_index > 0,
-            'has_more_after': end_index < len(context_messages),
-            'total_messages_in_thread': len(context_messages)
-        })
+    with connection() as con:
+        results = _context_windows(con, hits_sql, params, context_size)
     
-    con.close()
     return results
 
+def search_fts(query: str, context_size: int = 2, chat_id: int = None, limit: int = 200):
+    """
+    Full-text search over the messages_fts index, ranked by BM25.
+
+    Args:
+        query: FTS5 query string; supports phrases ("see you soon"),
+               prefixes (tomorr*) and boolean operators (pizza OR tacos)
+        context_size: Number of messages to include before and after the match (default: 2)
+        chat_id: Optional chat_id to filter results to a specific thread
+        limit: Maximum number of matches to return, best first (default: 200)
+
+    Returns:
+        Same shape as search_exact, best match first, with an extra `snippet`
+        field holding the matched text with hits wrapped in [ and ].
+    """
+    # snippet() and rank only work in the query that runs MATCH, so rank there
+    # and number the hits in an outer select.
+    fts_sql = """
+        SELECT m.message_id, m.chat_id, m.sent_at, t.title, f.rank AS score,
+               snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet
+        FROM messages_fts f
+        JOIN messages m ON m.message_id = f.rowid
+        JOIN threads t ON m.chat_id = t.chat_id
+        WHERE messages_fts MATCH :match
+    """
+    params = {'match': query, 'limit': limit}
+
+    if chat_id is not None:
+        fts_sql += " AND m.chat_id = :chat_id"
+        params['chat_id'] = chat_id
+
+    fts_sql += " ORDER BY f.rank LIMIT :limit"
+    hits_sql = f"""
+        SELECT message_id, chat_id, sent_at, title, snippet,
+               ROW_NUMBER() OVER (ORDER BY score, message_id) AS ord
+        FROM ({fts_sql})
+    """
+
+    with connection() as con:
+        has_fts = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+        ).fetchone()
+        if not has_fts:
+            raise ValueError("Full-text index not found in data/processed.db. Re-run: make imessage")
+        try:
+            results = _context_windows(con, hits_sql, params, context_size)
+        except sqlite3.OperationalError as e:
+            # Malformed FTS5 syntax (unbalanced quotes, stray operators, ...)
+            raise ValueError(f"Invalid search query: {e}")
+    return results
+
+def _encode_cursor(chat_id: int, sent_at: str, message_id: int) -> str:
+    """Opaque paging token for a message's (sent_at, message_id) position in a thread."""
+    raw = json.dumps([chat_id, sent_at, message_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor: str, chat_id: int):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_chat_id, sent_at, message_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if cursor_chat_id != chat_id:
+        raise ValueError("Cursor does not belong to this thread")
+    return sent_at, message_id
+
+def _page_before(con, chat_id: int, sent_at: str, message_id: int, limit: int):
+    """Up to `limit` messages strictly before a position, oldest first, plus has_more."""
+    rows = con.execute(
+        """
+        SELECT message_id, sent_at, sender_name, text
+        FROM messages
+        WHERE chat_id = ? AND (sent_at, message_id) < (?, ?)
+        ORDER BY sent_at DESC, message_id DESC
+        LIMIT ?
+        """,
+        (chat_id, sent_at, message_id, limit + 1)
+    ).fetchall()
+    return [dict(r) for r in reversed(rows[:limit])], len(rows) > limit
+
+def _page_after(con, chat_id: int, sent_at: str, message_id: int, limit: int):
+    """Up to `limit` messages strictly after a position, oldest first, plus has_more."""
+    rows = con.execute(
+        """
+        SELECT message_id, sent_at, sender_name, text
+        FROM messages
+        WHERE chat_id = ? AND (sent_at, message_id) > (?, ?)
+        ORDER BY sent_at, message_id
+        LIMIT ?
+        """,
+        (chat_id, sent_at, message_id, limit + 1)
+    ).fetchall()
+    return [dict(r) for r in rows[:limit]], len(rows) > limit
+
 def get_expanded_context(chat_id: int, message_id: int, before: int = 10, after: int = 10):
     """
     Get expanded context around a specific message.
@@ -159,43 +386,64 @@ def get_expanded_context(chat_id: int, message_id: int, before: int = 10, after:
         after: Number of messages to fetch after
         
     Returns:
-        Dict with messages before, the target message, and messages after
+        Dict with messages before, the target message, and messages after,
+        plus before_cursor/after_cursor for paging outward with get_context_page
     """
-    con = connect()
+    with connection() as con:
+        target = con.execute(
+            "SELECT message_id, sent_at, sender_name, text FROM messages WHERE chat_id = ? AND message_id = ?",
+            (chat_id, message_id)
+        ).fetchone()
+        
+        if target is None:
+            return {'messages': []}
+        
+        # Two bounded seeks on idx_messages_chat_time around the target
+        older, has_more_before = _page_before(con, chat_id, target['sent_at'], message_id, max(0, before))
+        newer, has_more_after = _page_after(con, chat_id, target['sent_at'], message_id, max(0, after))
     
-    # Get all messages in chronological order
-    all_messages = con.execute(
-        """
-        SELECT message_id, sent_at, sender_name, text
-        FROM messages
-        WHERE chat_id = ?
-        ORDER BY sent_at
-        """,
-        (chat_id,)
-    ).fetchall()
+    messages = older + [dict(target)] + newer
+    first, last = messages[0], messages[-1]
     
-    # Find target message index
-    target_index = None
-    for i, msg in enumerate(all_messages):
-        if msg['message_id'] == message_id:
-            target_index = i
-            break
+    return {
+        'messages': messages,
+        'target_index': len(older),
+        'has_more_before': has_more_before,
+        'has_more_after': has_more_after,
+        'before_cursor': _encode_cursor(chat_id, first['sent_at'], first['message_id']),
+        'after_cursor': _encode_cursor(chat_id, last['sent_at'], last['message_id'])
+    }
+
+def get_context_page(chat_id: int, cursor: str, direction: str, limit: int = 10):
+    """
+    Page outward from a cursor returned by search or get_expanded_context.
     
-    if target_index is None:
-        con.close()
-        return {'messages': []}
+    Args:
+        chat_id: The chat/thread ID
+        cursor: before_cursor or after_cursor from a previous response
+        direction: "before" for older messages, "after" for newer ones
+        limit: Number of messages to fetch
+        
+    Returns:
+        Dict with the page of messages (oldest first) and, for the requested
+        direction only, has_more_* and a new *_cursor to keep paging
+    """
+    if direction not in ("before", "after"):
+        raise ValueError("direction must be 'before' or 'after'")
+    sent_at, message_id = _decode_cursor(cursor, chat_id)
     
-    # Get expanded window
-    start = max(0, target_index - before)
-    end = min(len(all_messages), target_index + after + 1)
-    window = all_messages[start:end]
+    with connection() as con:
+        if direction == "before":
+            messages, has_more = _page_before(con, chat_id, sent_at, message_id, max(0, limit))
+        else:
+            messages, has_more = _page_after(con, chat_id, sent_at, message_id, max(0, limit))
     
-    messages = [dict(msg) for msg in window]
+    if messages:
+        edge = messages[0] if direction == "before" else messages[-1]
+        cursor = _encode_cursor(chat_id, edge['sent_at'], edge['message_id'])
     
-    con.close()
     return {
         'messages': messages,
-        'target_index': target_index - start,
-        'has_more_before': start > 0,
-        'has_more_after': end < len(all_messages)
+        f'has_more_{direction}': has_more,
+        f'{direction}_cursor': cursor
     }
@@ -11,7 +11,7 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from google.genai.errors import ClientError
-from app.imessage_store import list_threads, get_messages, search_exact, get_expanded_context
+from app.imessage_store import list_threads, get_messages, search_exact, search_fts, get_expanded_context, get_context_page
 from app.ask_service import ask
 
 app = FastAPI(title="iMessage Local API")
@@ -53,7 +53,7 @@ def messages(chat_id: int, limit: int = 50):
 
 
 @app.get("/search")
-def search(query: str, context_size: int = 2, chat_id: int = None, title: str = None):
+def search(query: str, context_size: int = 2, chat_id: int = None, title: str = None, mode: str = "exact"):
     """
     Search for exact keyword matches and return context windows.
     
@@ -62,32 +62,37 @@ def search(query: str, context_size: int = 2, chat_id: int = None, title: str =
         context_size: Number of messages before/after to include (default: 2)
         chat_id: Optional chat_id to filter to a specific thread
         title: Optional thread title to filter results (for contact/group filtering)
+        mode: "exact" for substring matches (newest first) or "fts" for full-text
+              matches ranked by BM25 (supports "phrases", prefix* and OR)
     """
     if not query or not query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
+    if mode not in ("exact", "fts"):
+        raise HTTPException(status_code=400, detail="mode must be 'exact' or 'fts'")
     
     try:
         # If title is provided, find the chat_id first
         filter_chat_id = chat_id
         if title and not chat_id:
-            from app.imessage_store import connect
-            con = connect()
-            result = con.execute(
-                "SELECT chat_id FROM threads WHERE title = ?",
-                (title,)
-            ).fetchone()
-            con.close()
+            from app.imessage_store import connection
+            with connection() as con:
+                result = con.execute(
+                    "SELECT chat_id FROM threads WHERE title = ?",
+                    (title,)
+                ).fetchone()
             if result:
                 filter_chat_id = result['chat_id']
         
-        results = search_exact(query.strip(), context_size=context_size, chat_id=filter_chat_id)
-        return {"query": query, "results": results, "count": len(results)}
-    except FileNotFoundError as e:
+        search_fn = search_fts if mode == "fts" else search_exact
+        results = search_fn(query.strip(), context_size=context_size, chat_id=filter_chat_id)
+        return {"query": query, "mode": mode, "results": results, "count": len(results)}
+    except (FileNotFoundError, ValueError) as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.get("/expand")
-def expand(chat_id: int, message_id: int, before: int = 10, after: int = 10):
+def expand(chat_id: int, message_id: int = None, before: int = 10, after: int = 10,
+           cursor: str = None, direction: str = None):
     """
     Get expanded context around a specific message.
     
@@ -96,11 +101,19 @@ def expand(chat_id: int, message_id: int, before: int = 10, after: int = 10):
         message_id: The central message ID
         before: Number of messages to load before (default: 10)
         after: Number of messages to load after (default: 10)
+        cursor: before_cursor/after_cursor from a previous /search or /expand
+                response; pages outward instead of re-centering on message_id
+        direction: "before" or "after" (required with cursor)
     """
     try:
+        if cursor:
+            limit = before if direction == "before" else after
+            return get_context_page(chat_id, cursor, direction, limit)
+        if message_id is None:
+            raise HTTPException(status_code=400, detail="message_id or cursor is required")
         result = get_expanded_context(chat_id, message_id, before, after)
         return result
-    except FileNotFoundError as e:
+    except (FileNotFoundError, ValueError) as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
@@ -1,5 +1,13 @@
+from __future__ import annotations
+
+from datetime import datetime
+import numbers
 from pathlib import Path
+from typing import Iterable, Sequence
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 DATA_DIR = REPO_ROOT / "data"
@@ -7,13 +15,144 @@ DATA_DIR = REPO_ROOT / "data"
 MESSAGES_PATH = DATA_DIR / "messages_cleaned.parquet"
 ATTACHMENTS_PATH = DATA_DIR / "attachments_cleaned.parquet"
 
-def load_messages() -> pd.DataFrame:
-    return pd.read_parquet(MESSAGES_PATH)
+# Partition-only column added by `extract_imessage.py --partition-by month`
+MONTH_COLUMN = "month"
+
+
+def open_dataset(path: Path, memory_map: bool = False) -> ds.Dataset:
+    """
+    Open a Parquet file or hive-partitioned directory as a pyarrow dataset.
+    Integer partition keys (e.g. chat_id=42) are read back as int64, matching
+    the unpartitioned file.
+    """
+    filesystem = fs.LocalFileSystem(use_mmap=memory_map)
+    dataset = ds.dataset(path, format="parquet", partitioning="hive", filesystem=filesystem)
+    schema = dataset.schema
+    for i, field in enumerate(schema):
+        if pa.types.is_integer(field.type) and field.type != pa.int64():
+            schema = schema.set(i, pa.field(field.name, pa.int64()))
+    if schema != dataset.schema:
+        dataset = ds.dataset(path, format="parquet", partitioning="hive", filesystem=filesystem, schema=schema)
+    return dataset
+
+
+def _unix_seconds(t: float | str | datetime | pd.Timestamp) -> float:
+    # numbers.Real also covers NumPy scalars, which pd.Timestamp would read as nanoseconds
+    if isinstance(t, numbers.Real):
+        return float(t)
+    ts = pd.Timestamp(t)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize("UTC")
+    return ts.timestamp()
+
+
+def message_filter(
+    dataset: ds.Dataset,
+    chat_id: int | Iterable[int] | None = None,
+    start: float | str | datetime | None = None,
+    end: float | str | datetime | None = None,
+    is_from_me: bool | None = None,
+) -> ds.Expression | None:
+    """
+    Build a pushdown filter for messages. start/end are inclusive bounds on
+    timestamp_unix (unix seconds, or anything pd.Timestamp accepts; naive
+    values are UTC). On month-partitioned data the bounds also prune whole
+    partitions.
+    """
+    parts = []
+    if chat_id is not None:
+        if isinstance(chat_id, numbers.Integral):
+            parts.append(ds.field("chat_id") == int(chat_id))
+        else:
+            parts.append(ds.field("chat_id").isin([int(c) for c in chat_id]))
+    month = MONTH_COLUMN in dataset.schema.names
+    if start is not None:
+        lo = _unix_seconds(start)
+        parts.append(ds.field("timestamp_unix") >= lo)
+        if month:
+            parts.append(ds.field(MONTH_COLUMN) >= pd.Timestamp(lo, unit="s").strftime("%Y-%m"))
+    if end is not None:
+        hi = _unix_seconds(end)
+        parts.append(ds.field("timestamp_unix") <= hi)
+        if month:
+            parts.append(ds.field(MONTH_COLUMN) <= pd.Timestamp(hi, unit="s").strftime("%Y-%m"))
+    if is_from_me is not None:
+        parts.append(ds.field("is_from_me") == int(is_from_me))
+
+    expr = None
+    for p in parts:
+        expr = p if expr is None else expr & p
+    return expr
+
+
+def _read(dataset: ds.Dataset, columns, expr, as_arrow: bool):
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c != MONTH_COLUMN]
+    table = dataset.to_table(columns=list(columns), filter=expr)
+    return table if as_arrow else table.to_pandas()
+
+
+def load_messages(
+    columns: Sequence[str] | None = None,
+    *,
+    chat_id: int | Iterable[int] | None = None,
+    start: float | str | datetime | None = None,
+    end: float | str | datetime | None = None,
+    is_from_me: bool | None = None,
+    where: ds.Expression | None = None,
+    as_arrow: bool = False,
+    memory_map: bool = False,
+) -> pd.DataFrame | pa.Table:
+    """
+    Read messages, only the requested columns and rows. Filters are pushed
+    down to the Parquet scan (row-group statistics and partition pruning);
+    `where` is ANDed with them for anything else.
+    """
+    dataset = open_dataset(MESSAGES_PATH, memory_map)
+    expr = message_filter(dataset, chat_id=chat_id, start=start, end=end, is_from_me=is_from_me)
+    if where is not None:
+        expr = where if expr is None else expr & where
+    return _read(dataset, columns, expr, as_arrow)
+
+
+def load_attachments(
+    columns: Sequence[str] | None = None,
+    *,
+    message_ids: Iterable[int] | None = None,
+    as_arrow: bool = False,
+    memory_map: bool = False,
+) -> pd.DataFrame | pa.Table:
+    dataset = open_dataset(ATTACHMENTS_PATH, memory_map)
+    expr = None if message_ids is None else ds.field("message_id").isin(list(message_ids))
+    return _read(dataset, columns, expr, as_arrow)
+
 
-def load_attachments() -> pd.DataFrame:
-    return pd.read_parquet(ATTACHMENTS_PATH)
+def load_messages_with_attachments(
+    columns: Sequence[str] | None = None,
+    attachment_columns: Sequence[str] | None = None,
+    *,
+    chat_id: int | Iterable[int] | None = None,
+    start: float | str | datetime | None = None,
+    end: float | str | datetime | None = None,
+    is_from_me: bool | None = None,
+    where: ds.Expression | None = None,
+    memory_map: bool = False,
+) -> pd.DataFrame:
+    """
+    Messages (filtered as in load_messages) left-joined to their attachments.
+    When any filter is given only the selected messages' attachments are read.
+    """
+    if columns is not None and "message_id" not in columns:
+        columns = [*columns, "message_id"]
+    if attachment_columns is not None and "message_id" not in attachment_columns:
+        attachment_columns = [*attachment_columns, "message_id"]
 
-def load_messages_with_attachments() -> pd.DataFrame:
-    m = load_messages()
-    a = load_attachments()
+    m = load_messages(
+        columns, chat_id=chat_id, start=start, end=end, is_from_me=is_from_me,
+        where=where, memory_map=memory_map,
+    )
+    filtered = any(f is not None for f in (chat_id, start, end, is_from_me, where))
+    a = load_attachments(
+        attachment_columns, message_ids=m["message_id"] if filtered else None, memory_map=memory_map,
+    )
     return m.merge(a, on="message_id", how="left")
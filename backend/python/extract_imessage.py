@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import argparse
 import shutil
 import sqlite3
 from pathlib import Path
 from datetime import datetime, timezone
+from typing import Iterator
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
 # ---------- Paths ----------
 HOME = Path.home()
@@ -18,6 +24,26 @@ TMP_DIR.mkdir(exist_ok=True)
 DATA_DIR.mkdir(exist_ok=True)
 
 APPLE_EPOCH_OFFSET = 978307200  # seconds between 1970-01-01 and 2001-01-01
+STREAM_CHUNKSIZE = 100_000      # rows per chunk / row group in --stream mode
+
+# Fixed schema for streamed writes, so every chunk (and partition file)
+# agrees even when a chunk has all-null or empty-list columns.
+MESSAGES_SCHEMA = pa.schema([
+    ("message_id", pa.int64()),
+    ("chat_id", pa.int64()),
+    ("chat_name", pa.string()),
+    ("chat_identifier", pa.string()),
+    ("is_group", pa.bool_()),
+    ("participants", pa.list_(pa.string())),
+    ("participant_count", pa.int64()),
+    ("sender", pa.string()),
+    ("is_from_me", pa.int64()),
+    ("text", pa.string()),
+    ("timestamp", pa.string()),
+    ("timestamp_unix", pa.float64()),
+    ("date_read", pa.string()),
+    ("date_delivered", pa.string()),
+])
 
 
 # ---------- Helpers ----------
@@ -40,7 +66,8 @@ def safe_copy_chat_db() -> Path:
 
 
 def connect(db_path: Path) -> sqlite3.Connection:
-    conn = sqlite3.connect(str(db_path))
+    # pyarrow's dataset writer pulls streamed chunks from its own thread
+    conn = sqlite3.connect(str(db_path), check_same_thread=False)
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -78,6 +105,46 @@ def unix_seconds_to_iso(x):
     return datetime.fromtimestamp(x, tz=timezone.utc).isoformat()
 
 
+def normalize_apple_time_series(s: pd.Series) -> pd.Series:
+    """
+    Vectorized normalize_apple_time_to_unix_seconds: same thresholds,
+    NaN for missing or non-numeric values.
+    """
+    x = pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64")
+    out = np.select(
+        [x > 1e12, x < 2_000_000_000],
+        [(x / 1e9) + APPLE_EPOCH_OFFSET, x + APPLE_EPOCH_OFFSET],
+        default=x,
+    )
+    return pd.Series(out, index=s.index)
+
+
+def unix_seconds_to_iso_series(s: pd.Series) -> pd.Series:
+    """
+    Vectorized unix_seconds_to_iso. Rounds to microseconds the same way
+    datetime.fromtimestamp does (half-even on the fractional part), and omits
+    the fraction when it is zero, like isoformat(). Missing values give None.
+    """
+    x = s.to_numpy(dtype="float64")
+    valid = ~np.isnan(x)
+    frac, whole = np.modf(np.where(valid, x, 0.0))
+    us = np.rint(frac * 1e6)
+    whole = np.where(us < 0, whole - 1, whole)
+    us = np.where(us < 0, us + 1e6, us)
+    whole = np.where(us >= 1e6, whole + 1, whole)
+    us = np.where(us >= 1e6, us - 1e6, us)
+
+    ts = pd.to_datetime(whole.astype("int64"), unit="s", utc=True).tz_localize(None).to_numpy()
+    ts = ts + us.astype("int64").astype("timedelta64[us]")
+    iso = np.where(
+        us != 0,
+        np.datetime_as_string(ts, unit="us"),
+        np.datetime_as_string(ts, unit="s"),
+    )
+    iso = np.char.add(iso, "+00:00").astype(object)
+    return pd.Series(np.where(valid, iso, None), index=s.index)
+
+
 def resolve_attachment_path(p: str | None) -> str | None:
     if not p:
         return None
@@ -91,12 +158,7 @@ def resolve_attachment_path(p: str | None) -> str | None:
 
 
 # ---------- Extraction ----------
-def extract_messages(conn: sqlite3.Connection) -> pd.DataFrame:
-    """
-    Pull messages joined to chats + handle (sender).
-    Uses message.ROWID as stable primary key.
-    """
-    q = """
+MESSAGES_QUERY = """
     SELECT
       m.ROWID                       AS message_id,
       c.ROWID                       AS chat_id,
@@ -119,7 +181,23 @@ def extract_messages(conn: sqlite3.Connection) -> pd.DataFrame:
     LEFT JOIN handle h
       ON h.ROWID = m.handle_id
     """
-    return pd.read_sql_query(q, conn)
+
+
+def extract_messages(conn: sqlite3.Connection) -> pd.DataFrame:
+    """
+    Pull messages joined to chats + handle (sender).
+    Uses message.ROWID as stable primary key.
+    """
+    return pd.read_sql_query(MESSAGES_QUERY, conn)
+
+
+def iter_messages(conn: sqlite3.Connection, chunksize: int = STREAM_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """
+    Same rows as extract_messages, oldest first, streamed from a cursor
+    `chunksize` rows at a time.
+    """
+    q = MESSAGES_QUERY + " ORDER BY m.date, m.ROWID"
+    return pd.read_sql_query(q, conn, chunksize=chunksize)
 
 
 def extract_chat_participants(conn: sqlite3.Connection) -> dict[int, list[str]]:
@@ -166,40 +244,49 @@ def clean_messages(messages_df: pd.DataFrame, participants_by_chat: dict[int, li
     df = messages_df.copy()
 
     # timestamps
-    df["timestamp_unix"] = df["date_raw"].apply(normalize_apple_time_to_unix_seconds)
-    df["timestamp"] = df["timestamp_unix"].apply(unix_seconds_to_iso)
-
-    df["date_read_unix"] = df["date_read_raw"].apply(normalize_apple_time_to_unix_seconds)
-    df["date_read"] = df["date_read_unix"].apply(unix_seconds_to_iso)
-
-    df["date_delivered_unix"] = df["date_delivered_raw"].apply(normalize_apple_time_to_unix_seconds)
-    df["date_delivered"] = df["date_delivered_unix"].apply(unix_seconds_to_iso)
-
-    # participants list
-    def parts(chat_id):
-        return participants_by_chat.get(int(chat_id), [])
-    df["participants"] = df["chat_id"].apply(parts)
-    df["participant_count"] = df["participants"].apply(len)
+    df["timestamp_unix"] = normalize_apple_time_series(df["date_raw"])
+    df["timestamp"] = unix_seconds_to_iso_series(df["timestamp_unix"])
+    df["date_read"] = unix_seconds_to_iso_series(normalize_apple_time_series(df["date_read_raw"]))
+    df["date_delivered"] = unix_seconds_to_iso_series(normalize_apple_time_series(df["date_delivered_raw"]))
+
+    # participants list: one entry per chat, attached to rows with a merge
+    chat_ids = df["chat_id"].astype("int64")
+    unique_ids = chat_ids.unique()
+    per_chat = [participants_by_chat.get(int(c), []) for c in unique_ids]
+    parts = pd.DataFrame({
+        "chat_id": unique_ids,
+        "participants": pd.Series(per_chat, dtype=object),
+        "participant_count": np.array([len(p) for p in per_chat], dtype="int64"),
+    })
+    merged = chat_ids.to_frame().merge(parts, on="chat_id", how="left")
+    df["participants"] = merged["participants"].to_numpy()
+    df["participant_count"] = merged["participant_count"].to_numpy()
 
     # group heuristic: >2 handles usually implies group (may include you)
-    df["is_group"] = df["participant_count"].apply(lambda n: n > 2)
+    df["is_group"] = df["participant_count"] > 2
 
     # sender field
     df["is_from_me"] = df["is_from_me"].fillna(0).astype(int)
     df["sender_handle"] = df["sender_handle"].fillna("")
-    df["sender"] = df.apply(lambda r: "me" if r["is_from_me"] == 1 else (r["sender_handle"] or "unknown"), axis=1)
-
-    # chat_name fallback
-    def compute_chat_name(row):
-        if row.get("display_name"):
-            return row["display_name"]
-        parts = row.get("participants") or []
-        if len(parts) <= 2:
-            # 1:1 chat fallback: use chat_identifier or sender
-            return row.get("chat_identifier") or (row["sender"] if row["sender"] != "me" else "Direct Chat")
-        return f"Group: {len(parts)} people"
-
-    df["chat_name"] = df.apply(compute_chat_name, axis=1)
+    handle = df["sender_handle"].to_numpy(dtype=object)
+    is_me = (df["is_from_me"] == 1).to_numpy()
+    df["sender"] = np.where(is_me, "me", np.where(handle != "", handle, "unknown")).astype(object)
+
+    # chat_name fallback:
+    # display_name, else (1:1) chat_identifier or the other sender, else group label
+    display = df["display_name"].to_numpy(dtype=object)
+    ident = df["chat_identifier"].to_numpy(dtype=object)
+    sender = df["sender"].to_numpy(dtype=object)
+    count = df["participant_count"].to_numpy()
+    has_display = pd.notna(display) & (display != "")
+    has_ident = pd.notna(ident) & (ident != "")
+    direct_name = np.where(has_ident, ident, np.where(sender != "me", sender, "Direct Chat"))
+    group_name = np.char.add(np.char.add("Group: ", count.astype(str)), " people").astype(object)
+    df["chat_name"] = np.select(
+        [has_display, count <= 2],
+        [display, direct_name],
+        default=group_name,
+    ).astype(object)
 
     # basic text cleanup
     df["text"] = df["text"].fillna("").astype(str)
@@ -222,29 +309,115 @@ def clean_attachments(att_df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+# ---------- Streaming ----------
+def _replace_path(tmp: Path, dst: Path):
+    if dst.is_dir():
+        shutil.rmtree(dst)
+    elif dst.exists():
+        dst.unlink()
+    tmp.rename(dst)
+
+
+def stream_messages_to_parquet(
+    conn: sqlite3.Connection,
+    participants_by_chat: dict[int, list[str]],
+    out_path: Path,
+    chunksize: int = STREAM_CHUNKSIZE,
+    partition_by: str | None = None,
+) -> tuple[int, pd.DataFrame | None]:
+    """
+    Clean messages chunk by chunk and write them without holding the whole
+    table in memory. Without `partition_by` each chunk becomes a row group
+    of a single Parquet file; with "month" or "chat_id" out_path is a
+    hive-partitioned dataset directory (e.g. month=2024-05/part-0.parquet).
+
+    Returns (rows written, first cleaned chunk for the sanity sample).
+    """
+    schema = MESSAGES_SCHEMA
+    if partition_by == "month":
+        schema = schema.append(pa.field("month", pa.string()))
+
+    rows = 0
+    first = None
+
+    def batches():
+        nonlocal rows, first
+        for chunk in iter_messages(conn, chunksize):
+            cleaned = clean_messages(chunk, participants_by_chat)
+            if partition_by == "month":
+                cleaned["month"] = cleaned["timestamp"].str.slice(0, 7)
+            if first is None:
+                first = cleaned.head(5)
+            rows += len(cleaned)
+            yield from pa.Table.from_pandas(cleaned, schema=schema, preserve_index=False).to_batches()
+
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    if tmp.is_dir():
+        shutil.rmtree(tmp)
+    elif tmp.exists():
+        tmp.unlink()
+
+    if partition_by is None:
+        with pq.ParquetWriter(tmp, schema) as writer:
+            for batch in batches():
+                writer.write_batch(batch, row_group_size=chunksize)
+    else:
+        ds.write_dataset(
+            batches(),
+            tmp,
+            schema=schema,
+            format="parquet",
+            partitioning=ds.partitioning(pa.schema([schema.field(partition_by)]), flavor="hive"),
+            existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=chunksize,
+        )
+
+    _replace_path(tmp, out_path)
+    return rows, first
+
+
 # ---------- Main ----------
 def main():
+    ap = argparse.ArgumentParser(description="Extract chat.db into cleaned Parquet files")
+    ap.add_argument("--stream", action="store_true",
+                    help="read, clean and write messages in chunks (flat memory use)")
+    ap.add_argument("--chunksize", type=int, default=STREAM_CHUNKSIZE,
+                    help=f"rows per chunk in --stream mode (default: {STREAM_CHUNKSIZE})")
+    ap.add_argument("--partition-by", choices=["month", "chat_id"],
+                    help="write messages as a hive-partitioned dataset (implies --stream)")
+    args = ap.parse_args()
+
     db_copy = safe_copy_chat_db()
     conn = connect(db_copy)
 
-    msgs_raw = extract_messages(conn)
     participants_by_chat = extract_chat_participants(conn)
     atts_raw = extract_attachments(conn)
-
-    msgs = clean_messages(msgs_raw, participants_by_chat)
     atts = clean_attachments(atts_raw)
 
     msgs_path = DATA_DIR / "messages_cleaned.parquet"
     atts_path = DATA_DIR / "attachments_cleaned.parquet"
 
-    msgs.to_parquet(msgs_path, index=False)
+    if args.stream or args.partition_by:
+        msg_rows, sample = stream_messages_to_parquet(
+            conn, participants_by_chat, msgs_path,
+            chunksize=args.chunksize, partition_by=args.partition_by,
+        )
+    else:
+        msgs_raw = extract_messages(conn)
+        msgs = clean_messages(msgs_raw, participants_by_chat)
+        if msgs_path.is_dir():
+            shutil.rmtree(msgs_path)
+        msgs.to_parquet(msgs_path, index=False)
+        msg_rows, sample = len(msgs), msgs.head(5)
+
     atts.to_parquet(atts_path, index=False)
 
     print("\n✅ Wrote outputs:")
-    print(" -", msgs_path, "rows:", len(msgs))
+    print(" -", msgs_path, "rows:", msg_rows)
     print(" -", atts_path, "rows:", len(atts))
-    print("\nSanity sample (first 5 messages):")
-    print(msgs[["chat_name", "sender", "timestamp", "text"]].head(5).to_string(index=False))
+    if sample is not None:
+        print("\nSanity sample (first 5 messages):")
+        print(sample[["chat_name", "sender", "timestamp", "text"]].to_string(index=False))
 
     conn.close()
 
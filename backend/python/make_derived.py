@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from data_contract import DATA_DIR, MESSAGES_PATH, MONTH_COLUMN, open_dataset
+
+CHATS_PATH = DATA_DIR / "chats_cleaned.parquet"
+PREVIEW_PATH = DATA_DIR / "messages_preview.parquet"
+STATE_PATH = DATA_DIR / "derived_state.json"
+
+PREVIEW_ROWS = 5000  # newest text messages kept for fast UI iteration
+CHAT_KEYS = ["chat_id", "chat_name", "is_group"]
+
+
+# ---------- Fragments ----------
+def fragment_signatures(dataset: ds.FileSystemDataset) -> dict[str, list[int]]:
+    """
+    path -> [size, mtime_ns] for every Parquet file backing the dataset.
+    """
+    sigs = {}
+    for frag in dataset.get_fragments():
+        st = Path(frag.path).stat()
+        sigs[frag.path] = [st.st_size, st.st_mtime_ns]
+    return sigs
+
+
+def load_state() -> dict | None:
+    if not STATE_PATH.exists():
+        return None
+    return json.loads(STATE_PATH.read_text())
+
+
+def new_fragments(state: dict | None, sigs: dict[str, list[int]], preview_rows: int) -> list[str] | None:
+    """
+    Fragments added since the last run, or None when the derived tables must
+    be rebuilt from scratch (no previous state, a different preview size, or
+    a previously scanned file changed or disappeared).
+    """
+    if state is None or not CHATS_PATH.exists() or not PREVIEW_PATH.exists():
+        return None
+    if state.get("source") != str(MESSAGES_PATH) or state.get("preview_rows") != preview_rows:
+        return None
+    seen = state.get("fragments", {})
+    if any(sigs.get(path) != sig for path, sig in seen.items()):
+        return None
+    return [path for path in sigs if path not in seen]
+
+
+# ---------- Aggregation ----------
+def chat_partial(batch: pa.RecordBatch) -> pd.DataFrame:
+    """
+    Per-chat aggregates for one batch, in the same shape as chats_cleaned so
+    partials (and a previous output) can be folded together with merge_chats.
+    """
+    df = batch.select(
+        ["chat_id", "chat_name", "is_group", "message_id", "timestamp_unix", "participants", "is_from_me", "text"]
+    ).to_pandas()
+    df["has_text"] = df["text"].fillna("").str.len() > 0
+    return df.groupby(CHAT_KEYS, as_index=False).agg(
+        message_count=("message_id", "count"),
+        text_message_count=("has_text", "sum"),
+        from_me_count=("is_from_me", "sum"),
+        last_timestamp_unix=("timestamp_unix", "max"),
+        participants=("participants", "first"),
+    )
+
+
+def merge_chats(partials: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Fold per-chat partials in scan order; participants keeps the first seen.
+    """
+    if not partials:
+        return pd.DataFrame(columns=[*CHAT_KEYS, "message_count", "text_message_count", "from_me_count",
+                                     "last_timestamp_unix", "participants"])
+    df = pd.concat(partials, ignore_index=True)
+    return df.groupby(CHAT_KEYS, as_index=False).agg(
+        message_count=("message_count", "sum"),
+        text_message_count=("text_message_count", "sum"),
+        from_me_count=("from_me_count", "sum"),
+        last_timestamp_unix=("last_timestamp_unix", "max"),
+        participants=("participants", "first"),
+    )
+
+
+def newest(table: pa.Table, k: int) -> pa.Table:
+    """
+    The k rows with the largest timestamp_unix, via argpartition (O(n)) rather
+    than sorting the whole table.
+    """
+    if table.num_rows <= k:
+        return table
+    ts = table["timestamp_unix"].to_numpy(zero_copy_only=False)
+    idx = np.argpartition(ts, table.num_rows - k)[table.num_rows - k:]
+    return table.take(pa.array(idx))
+
+
+# ---------- Scan ----------
+def scan(dataset: ds.Dataset, chats: list[pd.DataFrame], preview: pa.Table | None, preview_rows: int):
+    """
+    One pass over the dataset: fold every batch into the chat partials and
+    the running top-k preview.
+    """
+    columns = [c for c in dataset.schema.names if c != MONTH_COLUMN]
+    rows = 0
+    for batch in dataset.to_batches(columns=columns):
+        if batch.num_rows == 0:
+            continue
+        rows += batch.num_rows
+        chats.append(chat_partial(batch))
+
+        texts = batch.filter(pc.fill_null(pc.greater(pc.utf8_length(batch["text"]), 0), False))
+        candidates = pa.Table.from_batches([texts])
+        if preview is not None:
+            candidates = pa.concat_tables([preview, candidates.cast(preview.schema)])
+        preview = newest(candidates, preview_rows)
+
+        # Keep the partial list short on big scans
+        if len(chats) >= 64:
+            chats[:] = [merge_chats(chats)]
+    return preview, rows
+
+
+def build(full: bool = False, preview_rows: int = PREVIEW_ROWS, memory_map: bool = False) -> None:
+    dataset = open_dataset(MESSAGES_PATH, memory_map)
+    sigs = fragment_signatures(dataset)
+    todo = None if full else new_fragments(load_state(), sigs, preview_rows)
+
+    if todo is None:
+        chats, preview = [], None
+        source = dataset
+        print("Full build over", len(sigs), "file(s)")
+    elif not todo:
+        print("✅ Derived tables up to date")
+        return
+    else:
+        chats = [pd.read_parquet(CHATS_PATH)]
+        preview = pq.read_table(PREVIEW_PATH)
+        fragments = [f for f in dataset.get_fragments() if f.path in set(todo)]
+        source = ds.FileSystemDataset(fragments, dataset.schema, dataset.format, dataset.filesystem)
+        print("Incremental build over", len(todo), "new file(s)")
+
+    preview, rows = scan(source, chats, preview, preview_rows)
+
+    summary = merge_chats(chats).sort_values("last_timestamp_unix", ascending=False)
+    summary.to_parquet(CHATS_PATH, index=False)
+    print("✅ Wrote", CHATS_PATH, "rows:", len(summary))
+
+    if preview is None:
+        columns = [c for c in dataset.schema.names if c != MONTH_COLUMN]
+        preview = dataset.schema.empty_table().select(columns)
+    preview = preview.take(pc.sort_indices(preview, [("timestamp_unix", "ascending")]))
+    pq.write_table(preview, PREVIEW_PATH)
+    print("✅ Wrote", PREVIEW_PATH, "rows:", preview.num_rows)
+
+    STATE_PATH.write_text(json.dumps(
+        {"source": str(MESSAGES_PATH), "preview_rows": preview_rows, "fragments": sigs}, indent=2
+    ))
+    print("Scanned", rows, "messages")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build chats_cleaned and messages_preview in one scan")
+    ap.add_argument("--full", action="store_true",
+                    help="Rebuild from scratch instead of folding in new Parquet files only")
+    ap.add_argument("--preview-rows", type=int, default=PREVIEW_ROWS,
+                    help=f"Newest text messages kept in the preview (default {PREVIEW_ROWS})")
+    ap.add_argument("--mmap", action="store_true", help="Read Parquet files through memory maps")
+    args = ap.parse_args()
+    build(full=args.full, preview_rows=args.preview_rows, memory_map=args.mmap)
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,8 @@ export interface Thread {
   hasMoreAfter?: boolean // Whether there are more messages after this context
   chatId?: number // Chat ID for expansion
   matchMessageId?: number // Message ID for expansion
+  beforeCursor?: string // Paging token for loading earlier messages
+  afterCursor?: string // Paging token for loading later messages
 }
 
 export interface Contact {
@@ -145,9 +147,12 @@ function ConversationThread({ thread }: { thread: Thread }) {
   const [loadingAfter, setLoadingAfter] = useState(false)
   const [hasMoreBefore, setHasMoreBefore] = useState(thread.hasMoreBefore || false)
   const [hasMoreAfter, setHasMoreAfter] = useState(thread.hasMoreAfter || false)
+  const [beforeCursor, setBeforeCursor] = useState(thread.beforeCursor)
+  const [afterCursor, setAfterCursor] = useState(thread.afterCursor)
 
   const loadMore = async (direction: "before" | "after") => {
-    if (!thread.chatId || !thread.matchMessageId) return
+    const cursor = direction === "before" ? beforeCursor : afterCursor
+    if (!thread.chatId || !cursor) return
     
     if (direction === "before") {
       setLoadingBefore(true)
@@ -156,13 +161,9 @@ function ConversationThread({ thread }: { thread: Thread }) {
     }
 
     try {
-      const firstMsg = displayMessages[0]
-      const lastMsg = displayMessages[displayMessages.length - 1]
-      
-      // TODO: Get actual message IDs from the messages
-      // For now, use the match message ID as a reference
+      // Page outward from the edge of what is already shown
       const response = await fetch(
-        `http://localhost:8000/expand?chat_id=${thread.chatId}&message_id=${thread.matchMessageId}&before=10&after=10`
+        `http://localhost:8000/expand?chat_id=${thread.chatId}&cursor=${encodeURIComponent(cursor)}&direction=${direction}&before=10&after=10`
       )
       
       if (response.ok) {
@@ -170,14 +171,20 @@ function ConversationThread({ thread }: { thread: Thread }) {
         const newMessages: TextMessage[] = data.messages.map((msg: any) => ({
           sender: msg.sender_name === "ME" ? "You" : msg.sender_name,
           text: msg.text,
-          time: new Date(msg.sent_at).toLocaleTimeString('en-US', { hour: 'numeric', minute: '2-digit' }),
+          time: formatMessageTime(msg.sent_at),
           isUser: msg.sender_name === "ME",
           isMatch: false
         }))
         
-        setDisplayMessages(newMessages)
-        setHasMoreBefore(data.has_more_before)
-        setHasMoreAfter(data.has_more_after)
+        if (direction === "before") {
+          setDisplayMessages((prev) => [...newMessages, ...prev])
+          setHasMoreBefore(data.has_more_before)
+          setBeforeCursor(data.before_cursor)
+        } else {
+          setDisplayMessages((prev) => [...prev, ...newMessages])
+          setHasMoreAfter(data.has_more_after)
+          setAfterCursor(data.after_cursor)
+        }
       }
     } catch (error) {
       console.error("Failed to load more messages:", error)
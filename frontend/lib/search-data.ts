@@ -122,7 +122,9 @@ async function searchMessages(
       hasMoreBefore: result.has_more_before,
       hasMoreAfter: result.has_more_after,
       chatId: result.chat_id,
-      matchMessageId: result.match_message_id
+      matchMessageId: result.match_message_id,
+      beforeCursor: result.before_cursor,
+      afterCursor: result.after_cursor
     }
   })
   
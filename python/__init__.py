@@ -4,7 +4,11 @@ iMessage Assistant - Python Processing Module
 
 from .imessage_processor import (
     process_all,
+    update_index,
+    compact_index,
+    evaluate_recall,
     search_messages,
+    search_messages_batch,
     get_drama_summary,
     get_all_chat_names,
     load_data,
@@ -13,7 +17,11 @@ from .imessage_processor import (
 
 __all__ = [
     'process_all',
+    'update_index',
+    'compact_index',
+    'evaluate_recall',
     'search_messages',
+    'search_messages_batch',
     'get_drama_summary',
     'get_all_chat_names',
     'load_data',
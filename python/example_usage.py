@@ -5,7 +5,7 @@ This demonstrates how to use the processing functions in a UI application.
 
 from imessage_processor import (
     process_all,
-    search_messages,
+    search_messages_batch,
     get_drama_summary,
     get_all_chat_names,
 )
@@ -32,9 +32,11 @@ def main():
         "thanks",
     ]
     
-    for query in queries:
+    # All queries are embedded and searched in one batch
+    all_results = search_messages_batch(queries, top_k=3)
+    
+    for query, results in zip(queries, all_results):
         print(f"\nSearching for: '{query}'")
-        results = search_messages(query, top_k=3)
         
         if results:
             for i, result in enumerate(results, 1):
@@ -8,8 +8,12 @@ import pandas as pd
 import numpy as np
 import json
 import os
+import hashlib
+import numbers
+import sqlite3
+import time
 from pathlib import Path
-from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Tuple, Optional
 import faiss
 from sentence_transformers import SentenceTransformer
@@ -22,8 +26,64 @@ DATA_DIR = Path(__file__).parent / "data"
 EMBEDDINGS_DIR = Path(__file__).parent / "embeddings"
 CSV_PATH = DATA_DIR / "messages_cleaned.csv"
 FAISS_INDEX_PATH = EMBEDDINGS_DIR / "faiss_index"
-EMBEDDINGS_MAP_PATH = EMBEDDINGS_DIR / "message_id_map.pkl"
-DRAMA_SUMMARY_PATH = DATA_DIR / "drama_summary.json"
+ID_MAP_PATH = EMBEDDINGS_DIR / "message_ids.npy"
+EMBEDDINGS_PATH = EMBEDDINGS_DIR / "embeddings.npy"
+INDEX_META_PATH = EMBEDDINGS_DIR / "index_meta.json"
+SCOPES_DIR = EMBEDDINGS_DIR / "scopes"
+LEGACY_MAP_PATH = EMBEDDINGS_DIR / "message_id_map.pkl"
+DRAMA_SUMMARY_PATH = DATA_DIR / "drama_summary.db"
+LEGACY_SUMMARY_PATH = DATA_DIR / "drama_summary.json"
+EMBEDDING_CACHE_PATH = EMBEDDINGS_DIR / "embedding_cache.db"
+SENTIMENT_CACHE_PATH = DATA_DIR / "sentiment_cache.db"
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# Row layout of ID_MAP_PATH, aligned with embeddings.npy
+ID_MAP_DTYPE = np.dtype([('message_id', '<i8'), ('text_hash', 'S16')])
+# Rebuild the index once this fraction of it has been added/removed since the last build
+COMPACT_CHURN = 0.2
+
+# FAISS index types: exact ('flat') or approximate ('ivfpq', 'hnsw', 'sq8')
+INDEX_TYPES = ('flat', 'ivfpq', 'hnsw', 'sq8')
+INDEX_TYPE = 'flat'
+ANN_MIN_VECTORS = 10_000   # below this, approximate types fall back to 'flat'
+TRAIN_SAMPLE = 100_000     # vectors used to train IVF centroids / PQ codebooks / SQ ranges
+PQ_M = 48                  # PQ sub-quantizers (8 bits each); must divide the embedding dimension
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+# Query-time defaults (higher = better recall, slower)
+NPROBE = 16
+EF_SEARCH = 64
+
+# VADER scores, in the order stored in the sentiment cache and score arrays
+SENTIMENT_COLUMNS = ['sentiment_compound', 'sentiment_positive', 'sentiment_negative', 'sentiment_neutral']
+SENTIMENT_KEYS = ('compound', 'pos', 'neg', 'neu')
+SENTIMENT_CHUNK = 2000         # texts per scoring task
+SENTIMENT_POOL_MIN = 20_000    # below this many uncached texts, score in-process
+
+# Drama threads: runs of at least DRAMA_MIN_LENGTH consecutive messages below DRAMA_THRESHOLD
+DRAMA_THRESHOLD = -0.5
+DRAMA_MIN_LENGTH = 2
+
+# Keywords: lowercase word tokens of at least KEYWORD_MIN_LENGTH characters, minus stop words
+KEYWORD_TOKEN_PATTERN = r"[a-z0-9][a-z0-9']*[a-z0-9]"
+KEYWORD_MIN_LENGTH = 4
+KEYWORD_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did',
+    'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that',
+    'these', 'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him', 'her', 'us', 'them'
+})
+TOP_KEYWORDS = 20
+
+# Conversation summaries
+TOP_THREADS_PER_CHAT = 10
+SENTIMENT_BUCKET = 'W-MON'     # sentiment_over_time resample frequency ('D' daily, 'W-MON' weekly)
+MAX_SENTIMENT_POINTS = 100     # most recent buckets kept per chat
+
+# Message columns kept resident for query-time lookups
+LOOKUP_COLUMNS = ['message_id', 'chat_name', 'sender', 'text', 'timestamp']
+# Scoped searches over at most this many messages are exact (brute force over the scope)
+EXACT_SCOPE_MAX = 20_000
 
 # Ensure directories exist
 DATA_DIR.mkdir(exist_ok=True)
@@ -33,8 +93,16 @@ EMBEDDINGS_DIR.mkdir(exist_ok=True)
 _text_model = None
 _sentiment_analyzer = None
 _faiss_index = None
+_index_stamp = None
 _message_id_map = None
 _embeddings_array = None
+_message_table = None
+_message_table_stamp = None
+_scope_index = None
+_drama_store = None
+_drama_store_stamp = None
+_drama_summaries = {}
+_drama_chat_names = None
 
 
 def load_data() -> pd.DataFrame:
@@ -63,94 +131,509 @@ def load_data() -> pd.DataFrame:
     return df
 
 
-def generate_text_embeddings(df: pd.DataFrame) -> Tuple[np.ndarray, Dict[int, str]]:
+def get_text_model() -> SentenceTransformer:
+    """
+    Load the sentence-transformer model once per process.
+    """
+    global _text_model
+    
+    if _text_model is None:
+        print(f"Loading sentence-transformer model ({EMBEDDING_MODEL})...")
+        _text_model = SentenceTransformer(EMBEDDING_MODEL)
+    return _text_model
+
+
+def text_hash(text: str) -> bytes:
+    """
+    Stable 128-bit key for a message text (cache key together with the model name).
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+def open_embedding_cache() -> sqlite3.Connection:
+    """
+    Open (creating if needed) the on-disk embedding cache.
+    Vectors are stored as raw float32 bytes keyed by (model, text hash).
+    """
+    con = sqlite3.connect(EMBEDDING_CACHE_PATH)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            text_hash BLOB NOT NULL,
+            dim INTEGER NOT NULL,
+            vector BLOB NOT NULL,
+            PRIMARY KEY (model, text_hash)
+        ) WITHOUT ROWID
+    """)
+    return con
+
+
+def cached_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Embed texts, encoding only those not already in the cache.
+    Identical texts ("ok", "lol", ...) are looked up and encoded once and share a vector.
+    
+    Args:
+        texts: Message texts, in output row order
+    
+    Returns:
+        float32 array of shape (len(texts), dim)
+    """
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object))
+    hashes = [text_hash(t) for t in uniques]
+    
+    con = open_embedding_cache()
+    try:
+        con.execute("CREATE TEMP TABLE wanted (pos INTEGER PRIMARY KEY, text_hash BLOB NOT NULL)")
+        con.executemany("INSERT INTO wanted VALUES (?, ?)", enumerate(hashes))
+        rows = con.execute(
+            """
+            SELECT w.pos, e.vector FROM wanted w
+            JOIN embeddings e ON e.model = ? AND e.text_hash = w.text_hash
+            """,
+            (EMBEDDING_MODEL,),
+        ).fetchall()
+        
+        found = {pos: np.frombuffer(vec, dtype=np.float32) for pos, vec in rows}
+        missing = [pos for pos in range(len(uniques)) if pos not in found]
+        print(f"Embedding cache: {len(texts)} texts, {len(uniques)} unique, "
+              f"{len(found)} cached, {len(missing)} to encode")
+        
+        if missing:
+            model = get_text_model()
+            encoded = model.encode(
+                [uniques[pos] for pos in missing], show_progress_bar=True, convert_to_numpy=True
+            ).astype(np.float32)
+            with con:
+                con.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text_hash, dim, vector) VALUES (?, ?, ?, ?)",
+                    ((EMBEDDING_MODEL, hashes[pos], encoded.shape[1], encoded[i].tobytes())
+                     for i, pos in enumerate(missing)),
+                )
+            found.update(zip(missing, encoded))
+    finally:
+        con.close()
+    
+    if not found:
+        return np.zeros((0, get_text_model().get_sentence_embedding_dimension()), dtype=np.float32)
+    unique_vectors = np.stack([found[pos] for pos in range(len(uniques))])
+    return unique_vectors[codes]
+
+
+def make_id_map(df: pd.DataFrame) -> np.ndarray:
+    """
+    Structured (message_id, text_hash) array in DataFrame row order.
+    message_id is the FAISS id; text_hash detects edited messages on update.
+    """
+    id_map = np.empty(len(df), dtype=ID_MAP_DTYPE)
+    id_map['message_id'] = df['message_id'].to_numpy(dtype=np.int64)
+    id_map['text_hash'] = [text_hash(t) for t in df['text']]
+    return id_map
+
+
+def generate_text_embeddings(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
     """
     Step 2: Generate Text Embeddings
     Use sentence-transformers (all-MiniLM-L6-v2) to generate embeddings for all messages.
+    Only texts missing from the embedding cache are encoded.
     Save the embeddings in a numpy array linked to message_id.
     Build a FAISS index for semantic search.
     """
-    global _text_model
-    
     print("Generating text embeddings...")
     
-    # Load model (cached after first load)
-    if _text_model is None:
-        print("Loading sentence-transformer model (all-MiniLM-L6-v2)...")
-        _text_model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    # Generate embeddings for all messages
+    # Generate embeddings for all messages (new or changed texts only hit the model)
     texts = df['text'].tolist()
-    embeddings = _text_model.encode(texts, show_progress_bar=True, convert_to_numpy=True)
+    embeddings = cached_embeddings(texts)
     
-    # Create mapping from index to message_id
-    message_id_map = {i: str(msg_id) for i, msg_id in enumerate(df['message_id'])}
+    # Row-aligned message_id / text hash for each embedding
+    id_map = make_id_map(df)
     
     print(f"Generated {len(embeddings)} embeddings with dimension {embeddings.shape[1]}")
     
-    return embeddings, message_id_map
+    return embeddings, id_map
 
 
-def build_faiss_index(embeddings: np.ndarray, message_id_map: Dict[int, str]) -> faiss.Index:
+def make_index(dimension: int, n: int, index_type: str) -> faiss.Index:
     """
-    Build FAISS index for semantic search.
+    Create an empty (possibly untrained) inner-product index of the given type.
     """
-    print("Building FAISS index...")
+    if index_type == 'ivfpq':
+        # ~4*sqrt(n) lists, keeping at least 39 training points per centroid
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+        m = max(x for x in range(1, PQ_M + 1) if dimension % x == 0)
+        quantizer = faiss.IndexFlatIP(dimension)
+        return faiss.IndexIVFPQ(quantizer, dimension, nlist, m, 8, faiss.METRIC_INNER_PRODUCT)
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    if index_type == 'sq8':
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    return faiss.IndexFlatIP(dimension)
+
+
+def build_faiss_index(embeddings: np.ndarray, id_map: np.ndarray, index_type: str = INDEX_TYPE) -> faiss.Index:
+    """
+    Build FAISS index for semantic search, keyed directly by message_id.
     
-    dimension = embeddings.shape[1]
+    Args:
+        embeddings: Message embeddings (normalized in place)
+        id_map: Row-aligned message_id / text hash array
+        index_type: 'flat' (exact), 'ivfpq', 'hnsw' or 'sq8' (approximate)
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+    
+    n, dimension = embeddings.shape
+    if index_type != 'flat' and n < ANN_MIN_VECTORS:
+        print(f"Only {n} vectors; using an exact 'flat' index instead of '{index_type}'")
+        index_type = 'flat'
+    
+    print(f"Building FAISS index ({index_type})...")
     
     # Normalize embeddings for cosine similarity
     faiss.normalize_L2(embeddings)
     
     # Create FAISS index (using Inner Product for cosine similarity after normalization)
-    index = faiss.IndexFlatIP(dimension)
-    index.add(embeddings.astype('float32'))
+    inner = make_index(dimension, n, index_type)
+    if not inner.is_trained:
+        sample = embeddings
+        if n > TRAIN_SAMPLE:
+            rows = np.sort(np.random.default_rng(0).choice(n, TRAIN_SAMPLE, replace=False))
+            sample = embeddings[rows]
+        print(f"Training {index_type} index on {len(sample)} vectors...")
+        inner.train(sample)
+    
+    # Wrapped so search results and removals use message_ids rather than row positions
+    index = faiss.IndexIDMap2(inner)
+    add_messages(index, embeddings, id_map['message_id'])
     
     print(f"FAISS index built with {index.ntotal} vectors")
     
     return index
 
 
-def save_embeddings(embeddings: np.ndarray, message_id_map: Dict[int, str], index: faiss.Index):
+def search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                  sel: Optional[faiss.IDSelector] = None):
+    """
+    Query-time parameters for the index type: nprobe for IVF, efSearch for HNSW,
+    and an optional message_id selector restricting the search.
     """
-    Save embeddings, FAISS index, and message_id mapping.
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=nprobe or NPROBE, sel=sel)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=ef_search or EF_SEARCH, sel=sel)
+    return faiss.SearchParameters(sel=sel) if sel is not None else None
+
+
+def add_messages(index: faiss.Index, embeddings: np.ndarray, message_ids: np.ndarray):
     """
+    Add vectors for message_ids not already in the index.
+    Embeddings are L2-normalized in place for cosine similarity.
+    """
+    if len(message_ids) == 0:
+        return
+    faiss.normalize_L2(embeddings)
+    index.add_with_ids(embeddings, np.ascontiguousarray(message_ids, dtype=np.int64))
+
+
+def remove_messages(index: faiss.Index, message_ids: np.ndarray) -> int:
+    """
+    Remove the given message_ids from the index. Unknown ids are ignored.
+    HNSW indexes cannot remove vectors and raise RuntimeError.
+    
+    Returns:
+        Number of vectors removed
+    """
+    if len(message_ids) == 0 or index.ntotal == 0:
+        return 0
+    return index.remove_ids(np.ascontiguousarray(message_ids, dtype=np.int64))
+
+
+def load_index_meta() -> Dict:
+    if not INDEX_META_PATH.exists():
+        return {}
+    with open(INDEX_META_PATH, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_atomic(path: Path, write):
+    """
+    Write via a temp file and rename, so processes that have the old file
+    memory-mapped keep a consistent copy until they reload.
+    """
+    tmp = path.with_name(path.name + '.tmp')
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _save_array(path: Path, array: np.ndarray):
+    def write(tmp: Path):
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+    _write_atomic(path, write)
+
+
+def save_scopes(scopes: Dict[str, np.ndarray]):
+    """
+    Save the scope index as one .npy per array (memory-mappable).
+    """
+    SCOPES_DIR.mkdir(exist_ok=True)
+    for name, array in scopes.items():
+        _save_array(SCOPES_DIR / f"{name}.npy", array)
+
+
+def load_scopes(mmap: bool = True) -> Optional[Dict[str, np.ndarray]]:
+    paths = sorted(SCOPES_DIR.glob("*.npy")) if SCOPES_DIR.exists() else []
+    if not paths:
+        return None
+    return {path.stem: np.load(path, mmap_mode='r' if mmap else None) for path in paths}
+
+
+def save_embeddings(embeddings: np.ndarray, id_map: np.ndarray, index: faiss.Index,
+                    index_type: str = INDEX_TYPE, churn: int = 0):
+    """
+    Save embeddings, FAISS index, and the aligned message_id map.
+    Every file is replaced atomically; index_meta.json is written last and
+    signals other processes to reload.
+    
+    Args:
+        index_type: Index type the index was built as (kept on update/compaction)
+        churn: Vectors added/removed since the index was last built from scratch
+    """
+    global _scope_index, _index_stamp
+    
     print("Saving embeddings and FAISS index...")
     
     # Save FAISS index
-    faiss.write_index(index, str(FAISS_INDEX_PATH))
+    _write_atomic(FAISS_INDEX_PATH, lambda tmp: faiss.write_index(index, str(tmp)))
     
-    # Save message_id mapping
-    with open(EMBEDDINGS_MAP_PATH, 'wb') as f:
-        pickle.dump(message_id_map, f)
+    # Save message_id map (row i describes embeddings[i])
+    _save_array(ID_MAP_PATH, id_map)
     
     # Save embeddings array
-    np.save(EMBEDDINGS_DIR / "embeddings.npy", embeddings)
+    _save_array(EMBEDDINGS_PATH, embeddings)
+    
+    # Save chat / time scopes over the same rows for filtered search
+    _scope_index = build_scope_index(id_map)
+    save_scopes(_scope_index)
+    
+    with open(INDEX_META_PATH, 'w', encoding='utf-8') as f:
+        json.dump({'model': EMBEDDING_MODEL, 'index_type': index_type,
+                   'ntotal': int(index.ntotal), 'churn': churn}, f)
+    
+    _index_stamp = INDEX_META_PATH.stat().st_mtime_ns
+    
+    # The positional pickle map is superseded by message_id-keyed FAISS ids
+    LEGACY_MAP_PATH.unlink(missing_ok=True)
     
     print(f"Saved FAISS index to {FAISS_INDEX_PATH}")
-    print(f"Saved message_id map to {EMBEDDINGS_MAP_PATH}")
+    print(f"Saved message_id map to {ID_MAP_PATH}")
 
 
-def load_embeddings() -> Tuple[faiss.Index, Dict[int, str], np.ndarray]:
+def load_embeddings(mmap: bool = True) -> Tuple[faiss.Index, np.ndarray, np.ndarray]:
     """
     Load saved embeddings and FAISS index.
+    An index saved in the old positional format is ignored (rebuild with process_all()).
+    
+    Args:
+        mmap: Memory-map the embeddings, id map and (where FAISS supports it) the
+            index read-only, so worker processes share the OS page cache instead
+            of each holding a private copy. Use mmap=False to modify the index.
     """
-    global _faiss_index, _message_id_map, _embeddings_array
+    global _faiss_index, _index_stamp, _message_id_map, _embeddings_array, _scope_index
     
-    if _faiss_index is None and FAISS_INDEX_PATH.exists():
+    if _faiss_index is None and FAISS_INDEX_PATH.exists() and ID_MAP_PATH.exists():
         print("Loading FAISS index...")
-        _faiss_index = faiss.read_index(str(FAISS_INDEX_PATH))
+        _index_stamp = INDEX_META_PATH.stat().st_mtime_ns if INDEX_META_PATH.exists() else None
+        flags = 0
+        if mmap:
+            # IVF inverted lists are mapped with IO_FLAG_MMAP; flat/SQ/HNSW codes with
+            # IO_FLAG_MMAP_IFC (newer FAISS only). Combining both fails on IVF indexes.
+            ifc = getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+            ivf = load_index_meta().get('index_type') == 'ivfpq'
+            flags = faiss.IO_FLAG_READ_ONLY | (faiss.IO_FLAG_MMAP if ivf or not ifc else ifc)
+        _faiss_index = faiss.read_index(str(FAISS_INDEX_PATH), flags)
+        mmap_mode = 'r' if mmap else None
+        _message_id_map = np.load(ID_MAP_PATH, mmap_mode=mmap_mode)
+        _scope_index = None
         
-        with open(EMBEDDINGS_MAP_PATH, 'rb') as f:
-            _message_id_map = pickle.load(f)
-        
-        embeddings_path = EMBEDDINGS_DIR / "embeddings.npy"
-        if embeddings_path.exists():
-            _embeddings_array = np.load(embeddings_path)
+        if EMBEDDINGS_PATH.exists():
+            _embeddings_array = np.load(EMBEDDINGS_PATH, mmap_mode=mmap_mode)
     
     return _faiss_index, _message_id_map, _embeddings_array
 
 
+def reset_embeddings():
+    """
+    Drop the loaded index, id map, embeddings and scopes (next use reloads them).
+    """
+    global _faiss_index, _index_stamp, _message_id_map, _embeddings_array, _scope_index
+    
+    _faiss_index = _index_stamp = _message_id_map = _embeddings_array = _scope_index = None
+
+
+def update_index(df: pd.DataFrame, rebuild: bool = False, index_type: Optional[str] = None) -> faiss.Index:
+    """
+    Bring the saved FAISS index in line with df.
+    New and edited messages are embedded and added, deleted ones removed;
+    everything else is left in place. Falls back to a full build when there is
+    no usable index, and compacts (rebuilds) once churn exceeds COMPACT_CHURN,
+    when the index type changes, or when removals hit an HNSW index.
+    
+    Args:
+        df: Current messages (message_id, text)
+        rebuild: Force a full rebuild
+        index_type: Index type to build (defaults to the saved index's type)
+    
+    Returns:
+        The updated index
+    """
+    global _faiss_index, _message_id_map, _embeddings_array
+    
+    meta = load_index_meta()
+    saved_type = meta.get('index_type', 'flat')
+    index_type = index_type or (saved_type if meta else INDEX_TYPE)
+    
+    # Load a private, writable copy (the query path maps files read-only)
+    reset_embeddings()
+    index, old_map, old_embeddings = (None, None, None) if rebuild else load_embeddings(mmap=False)
+    if index is None or old_embeddings is None or meta.get('model') != EMBEDDING_MODEL:
+        embeddings, id_map = generate_text_embeddings(df)
+        index = build_faiss_index(embeddings, id_map, index_type)
+        save_embeddings(embeddings, id_map, index, index_type)
+        _faiss_index, _message_id_map, _embeddings_array = index, id_map, embeddings
+        return index
+    
+    print("Updating FAISS index...")
+    new_map = make_id_map(df)
+    
+    # Rows unchanged in both message_id and text stay; the rest are stale or new
+    keep = np.isin(old_map, new_map)
+    fresh = ~np.isin(new_map, old_map)
+    stale_ids = old_map['message_id'][~keep]
+    
+    added_embeddings = cached_embeddings(df['text'][fresh].tolist())
+    faiss.normalize_L2(added_embeddings)
+    embeddings = np.concatenate([old_embeddings[keep], added_embeddings])
+    id_map = np.concatenate([old_map[keep], new_map[fresh]])
+    churn = meta.get('churn', 0) + len(stale_ids) + int(fresh.sum())
+    print(f"Removing {len(stale_ids)}, adding {int(fresh.sum())} vectors")
+    
+    if index_type != saved_type or churn > COMPACT_CHURN * max(len(id_map), 1):
+        return compact_index(embeddings, id_map, index_type)
+    
+    try:
+        remove_messages(index, stale_ids)
+    except RuntimeError:
+        # HNSW graphs cannot drop vectors; rebuild without them
+        return compact_index(embeddings, id_map, index_type)
+    add_messages(index, added_embeddings, new_map['message_id'][fresh])
+    
+    save_embeddings(embeddings, id_map, index, index_type, churn=churn)
+    _faiss_index, _message_id_map, _embeddings_array = index, id_map, embeddings
+    return index
+
+
+def compact_index(embeddings: Optional[np.ndarray] = None, id_map: Optional[np.ndarray] = None,
+                  index_type: Optional[str] = None) -> faiss.Index:
+    """
+    Rebuild the index from the saved (already normalized) embeddings, dropping
+    the fragmentation left by incremental adds and removes. Approximate index
+    types are retrained on the current vectors.
+    """
+    global _faiss_index, _message_id_map, _embeddings_array
+    
+    if embeddings is None or id_map is None:
+        reset_embeddings()
+        index, id_map, embeddings = load_embeddings()
+        if index is None or embeddings is None:
+            raise ValueError("FAISS index not found. Please run process_all() first.")
+    index_type = index_type or load_index_meta().get('index_type', INDEX_TYPE)
+    
+    print(f"Compacting FAISS index ({len(id_map)} vectors)...")
+    # Store rows in message_id order so compaction is deterministic
+    order = np.argsort(id_map['message_id'], kind='stable')
+    embeddings = np.ascontiguousarray(embeddings[order], dtype=np.float32)
+    id_map = id_map[order]
+    index = build_faiss_index(embeddings, id_map, index_type)
+    save_embeddings(embeddings, id_map, index, index_type)
+    
+    _faiss_index, _message_id_map, _embeddings_array = index, id_map, embeddings
+    return index
+
+
+def evaluate_recall(index_types: Tuple[str, ...] = ('ivfpq', 'hnsw', 'sq8'), k: int = 10,
+                    n_queries: int = 500, queries: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Report recall@k of approximate index types against the exact flat index,
+    over the saved embeddings, for a sweep of nprobe / efSearch settings.
+    
+    Args:
+        index_types: Approximate types to evaluate
+        k: Neighbours compared per query
+        n_queries: Queries sampled from the indexed messages (ignored if queries is given)
+        queries: Optional query strings to embed instead
+    
+    Returns:
+        One dict per (index_type, setting) with recall, ms_per_query and index_mb;
+        empty below ANN_MIN_VECTORS, where approximate types would be built as 'flat'
+    """
+    _, id_map, embeddings = load_embeddings()
+    if embeddings is None:
+        raise ValueError("Embeddings not found. Please run process_all() first.")
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    
+    # build_faiss_index falls back to 'flat' here, which would report a meaningless recall of 1.0
+    if len(embeddings) < ANN_MIN_VECTORS:
+        print(f"Only {len(embeddings)} vectors (< {ANN_MIN_VECTORS}); approximate index types are "
+              f"built as 'flat', skipping {', '.join(index_types)}")
+        return []
+    
+    if queries:
+        query_vectors = get_text_model().encode(queries, convert_to_numpy=True).astype(np.float32)
+        faiss.normalize_L2(query_vectors)
+    else:
+        rows = np.random.default_rng(1).choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)
+        query_vectors = embeddings[rows]
+    
+    # Ground truth from an exact search
+    flat = faiss.IndexFlatIP(embeddings.shape[1])
+    flat.add(embeddings)
+    _, truth = flat.search(query_vectors, k)
+    truth = id_map['message_id'][truth]
+    
+    sweeps = {'ivfpq': ('nprobe', (1, 4, 16, 64)), 'hnsw': ('ef_search', (16, 32, 64, 128))}
+    report = []
+    for index_type in index_types:
+        index = build_faiss_index(embeddings.copy(), id_map, index_type)
+        index_mb = faiss.serialize_index(index).nbytes / 1e6
+        knob, values = sweeps.get(index_type, (None, (None,)))
+        for value in values:
+            params = search_params(index, **({knob: value} if knob else {}))
+            start = time.perf_counter()
+            _, found = index.search(query_vectors, k, params=params)
+            elapsed = time.perf_counter() - start
+            hits = sum(len(np.intersect1d(f, t)) for f, t in zip(found, truth))
+            report.append({
+                'index_type': index_type,
+                'setting': f"{knob}={value}" if knob else '',
+                f'recall@{k}': hits / truth.size,
+                'ms_per_query': 1000 * elapsed / len(query_vectors),
+                'index_mb': index_mb,
+            })
+    
+    print(f"\nRecall@{k} vs flat ({len(query_vectors)} queries, {len(embeddings)} vectors, "
+          f"flat index {embeddings.nbytes / 1e6:.0f} MB)")
+    for r in report:
+        print(f"  {r['index_type']:<6} {r['setting']:<14} recall={r[f'recall@{k}']:.3f}  "
+              f"{r['ms_per_query']:.3f} ms/query  {r['index_mb']:.0f} MB")
+    
+    return report
+
+
 def generate_image_embeddings(df: pd.DataFrame) -> Optional[Dict[str, np.ndarray]]:
     """
     Step 3 (Optional): Image Embeddings
@@ -210,164 +693,356 @@ def generate_image_embeddings(df: pd.DataFrame) -> Optional[Dict[str, np.ndarray
     return image_embeddings
 
 
-def detect_drama(df: pd.DataFrame) -> pd.DataFrame:
+def get_sentiment_analyzer() -> SentimentIntensityAnalyzer:
+    """
+    Load the VADER analyzer once per process.
+    """
+    global _sentiment_analyzer
+    
+    if _sentiment_analyzer is None:
+        _sentiment_analyzer = SentimentIntensityAnalyzer()
+    return _sentiment_analyzer
+
+
+def score_sentiment(texts: List[str]) -> np.ndarray:
+    """
+    VADER scores for texts as a float32 array of shape (len(texts), 4),
+    columns in SENTIMENT_KEYS order. Runs in pool workers too.
+    """
+    analyzer = get_sentiment_analyzer()
+    scores = np.empty((len(texts), len(SENTIMENT_KEYS)), dtype=np.float32)
+    for i, text in enumerate(texts):
+        polarity = analyzer.polarity_scores(text)
+        scores[i] = [polarity[key] for key in SENTIMENT_KEYS]
+    return scores
+
+
+def open_sentiment_cache() -> sqlite3.Connection:
+    """
+    Open (creating if needed) the on-disk sentiment cache, keyed by text hash.
+    """
+    con = sqlite3.connect(SENTIMENT_CACHE_PATH)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS sentiment (
+            text_hash BLOB PRIMARY KEY,
+            compound REAL NOT NULL,
+            pos REAL NOT NULL,
+            neg REAL NOT NULL,
+            neu REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    return con
+
+
+def cached_sentiment(texts: List[str], workers: Optional[int] = None) -> np.ndarray:
+    """
+    Sentiment scores for texts, scoring only unique texts not already cached.
+    Large batches of uncached texts are split across a process pool.
+    
+    Args:
+        texts: Message texts, in output row order
+        workers: Pool size (default: CPU count; 1 scores in-process)
+    
+    Returns:
+        float32 array of shape (len(texts), 4), columns in SENTIMENT_KEYS order
+    """
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object))
+    hashes = [text_hash(t) for t in uniques]
+    scores = np.empty((len(uniques), len(SENTIMENT_KEYS)), dtype=np.float32)
+    
+    con = open_sentiment_cache()
+    try:
+        con.execute("CREATE TEMP TABLE wanted (pos INTEGER PRIMARY KEY, text_hash BLOB NOT NULL)")
+        con.executemany("INSERT INTO wanted VALUES (?, ?)", enumerate(hashes))
+        rows = con.execute("""
+            SELECT w.pos, s.compound, s.pos, s.neg, s.neu FROM wanted w
+            JOIN sentiment s ON s.text_hash = w.text_hash
+        """).fetchall()
+        
+        found = np.zeros(len(uniques), dtype=bool)
+        if rows:
+            cached = np.array(rows, dtype=np.float64)
+            positions = cached[:, 0].astype(np.int64)
+            scores[positions] = cached[:, 1:]
+            found[positions] = True
+        missing = np.flatnonzero(~found)
+        print(f"Sentiment cache: {len(texts)} texts, {len(uniques)} unique, "
+              f"{int(found.sum())} cached, {len(missing)} to score")
+        
+        if len(missing):
+            pending = [uniques[pos] for pos in missing]
+            chunks = [pending[i:i + SENTIMENT_CHUNK] for i in range(0, len(pending), SENTIMENT_CHUNK)]
+            workers = workers or os.cpu_count() or 1
+            if workers > 1 and len(pending) >= SENTIMENT_POOL_MIN:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    parts = list(tqdm(pool.map(score_sentiment, chunks), total=len(chunks), desc="Analyzing sentiment"))
+            else:
+                parts = [score_sentiment(chunk) for chunk in tqdm(chunks, desc="Analyzing sentiment")]
+            scores[missing] = np.concatenate(parts)
+            
+            with con:
+                con.executemany(
+                    "INSERT OR REPLACE INTO sentiment (text_hash, compound, pos, neg, neu) VALUES (?, ?, ?, ?, ?)",
+                    ((hashes[pos], *map(float, scores[pos])) for pos in missing),
+                )
+    finally:
+        con.close()
+    
+    return scores[codes]
+
+
+def detect_drama(df: pd.DataFrame, workers: Optional[int] = None) -> pd.DataFrame:
     """
     Step 4: Drama Detection
     Perform sentiment analysis on text using VADER.
     Add a column sentiment to the DataFrame.
     Detect "drama threads" by identifying consecutive messages with strongly negative sentiment.
-    """
-    global _sentiment_analyzer
     
+    Args:
+        df: Messages with a text column
+        workers: Sentiment scoring processes (default: CPU count)
+    """
     print("Performing sentiment analysis...")
     
-    if _sentiment_analyzer is None:
-        _sentiment_analyzer = SentimentIntensityAnalyzer()
-    
-    # Calculate sentiment scores
-    sentiment_scores = []
-    for text in tqdm(df['text'], desc="Analyzing sentiment"):
-        scores = _sentiment_analyzer.polarity_scores(text)
-        sentiment_scores.append(scores)
+    # Calculate sentiment scores (deduplicated, cached per text hash)
+    scores = cached_sentiment(df['text'].tolist(), workers)
     
-    # Add sentiment columns
-    df['sentiment_compound'] = [s['compound'] for s in sentiment_scores]
-    df['sentiment_positive'] = [s['pos'] for s in sentiment_scores]
-    df['sentiment_negative'] = [s['neg'] for s in sentiment_scores]
-    df['sentiment_neutral'] = [s['neu'] for s in sentiment_scores]
+    # Add sentiment columns (float32)
+    for i, column in enumerate(SENTIMENT_COLUMNS):
+        df[column] = scores[:, i]
     
-    print(f"Sentiment analysis complete. Negative messages: {(df['sentiment_compound'] < -0.5).sum()}")
+    print(f"Sentiment analysis complete. Negative messages: {(df['sentiment_compound'] < DRAMA_THRESHOLD).sum()}")
     
     return df
 
 
-def find_drama_threads(df: pd.DataFrame) -> List[Dict]:
+def find_drama_threads(df: pd.DataFrame, threshold: float = DRAMA_THRESHOLD,
+                       min_length: int = DRAMA_MIN_LENGTH) -> List[Dict]:
     """
     Identify consecutive messages or threads where sentiment is strongly negative.
     Aggregate by chat_name and time to find top dramatic conversations.
+    
+    Run boundaries are found with NumPy over the whole sorted frame; message
+    payloads are only built for runs that qualify.
+    
+    Args:
+        df: Messages with sentiment_compound (see detect_drama)
+        threshold: Messages with sentiment_compound below this are negative
+        min_length: Minimum consecutive negative messages in a thread
     """
     print("Detecting drama threads...")
     
     # Sort by chat_name and timestamp
-    df_sorted = df.sort_values(['chat_name', 'timestamp']).copy()
+    df_sorted = df[df['chat_name'].notna()].sort_values(['chat_name', 'timestamp'], kind='stable')
+    chat = pd.factorize(df_sorted['chat_name'])[0]
+    sentiment = df_sorted['sentiment_compound'].to_numpy(dtype=np.float64)
+    
+    # Identify negative messages and where each negative run starts / ends within a chat
+    is_negative = sentiment < threshold
+    chat_change = chat[1:] != chat[:-1]
+    starts = np.flatnonzero(is_negative & np.r_[True, ~is_negative[:-1] | chat_change])
+    ends = np.flatnonzero(is_negative & np.r_[~is_negative[1:] | chat_change, True]) + 1
+    lengths = ends - starts
+    
+    qualifying = lengths >= min_length
+    starts, ends, lengths = starts[qualifying], ends[qualifying], lengths[qualifying]
+    # Per-run sums (reduceat over [start, end) pairs; a global cumsum would add cancellation error)
+    bounds = np.column_stack([starts, ends]).ravel()
+    sums = np.add.reduceat(np.r_[sentiment, 0.0], bounds)[::2] if len(bounds) else np.zeros(0)
+    averages = sums / np.maximum(lengths, 1)
     
-    # Identify negative messages
-    df_sorted['is_negative'] = df_sorted['sentiment_compound'] < -0.5
-    
-    drama_threads = []
+    # Sort by sentiment (most negative first) and thread length
+    order = np.lexsort((-lengths, averages))
     
-    # Group by chat_name
-    for chat_name, chat_df in df_sorted.groupby('chat_name'):
-        chat_df = chat_df.reset_index(drop=True)
-        
-        # Find consecutive negative message sequences
-        current_thread = []
-        for idx, row in chat_df.iterrows():
-            if row['is_negative']:
-                current_thread.append({
-                    'message_id': str(row['message_id']),
-                    'text': row['text'],
-                    'sender': row['sender'],
-                    'timestamp': row['timestamp'],
-                    'sentiment': row['sentiment_compound']
-                })
-            else:
-                # End of thread
-                if len(current_thread) >= 2:  # At least 2 consecutive negative messages
-                    avg_sentiment = np.mean([m['sentiment'] for m in current_thread])
-                    drama_threads.append({
-                        'chat_name': chat_name,
-                        'message_ids': [m['message_id'] for m in current_thread],
-                        'messages': current_thread,
-                        'sentiment_avg': float(avg_sentiment),
-                        'thread_length': len(current_thread)
-                    })
-                current_thread = []
-        
-        # Handle thread at end of chat
-        if len(current_thread) >= 2:
-            avg_sentiment = np.mean([m['sentiment'] for m in current_thread])
-            drama_threads.append({
-                'chat_name': chat_name,
-                'message_ids': [m['message_id'] for m in current_thread],
-                'messages': current_thread,
-                'sentiment_avg': float(avg_sentiment),
-                'thread_length': len(current_thread)
-            })
+    # Materialize only the qualifying runs
+    chat_names = df_sorted['chat_name'].to_numpy()
+    message_ids = df_sorted['message_id'].to_numpy()
+    texts = df_sorted['text'].to_numpy()
+    senders = df_sorted['sender'].to_numpy()
+    timestamps = df_sorted['timestamp'].to_numpy()
     
-    # Sort by sentiment (most negative first) and thread length
-    drama_threads.sort(key=lambda x: (x['sentiment_avg'], -x['thread_length']))
+    drama_threads = []
+    for i in order:
+        run = slice(starts[i], ends[i])
+        ids = [str(m) for m in message_ids[run]]
+        drama_threads.append({
+            'chat_name': chat_names[starts[i]],
+            'message_ids': ids,
+            'messages': [
+                {'message_id': m, 'text': t, 'sender': snd, 'timestamp': ts, 'sentiment': float(sc)}
+                for m, t, snd, ts, sc in zip(ids, texts[run], senders[run], timestamps[run], sentiment[run])
+            ],
+            'sentiment_avg': float(averages[i]),
+            'thread_length': int(lengths[i])
+        })
     
     print(f"Found {len(drama_threads)} drama threads")
     
     return drama_threads
 
 
-def extract_keywords(df: pd.DataFrame, drama_threads: List[Dict], top_n: int = 20) -> List[str]:
+def build_term_matrix(texts: pd.Series) -> Dict[str, np.ndarray]:
     """
-    Extract top recurring keywords in negative threads.
-    """
-    print("Extracting keywords from drama threads...")
+    Sparse message x term count matrix in coordinate form, built with
+    vectorized tokenization (no per-message Python loop).
     
-    # Get all message IDs from drama threads
-    drama_message_ids = set()
-    for thread in drama_threads:
-        drama_message_ids.update(thread['message_ids'])
-    
-    # Filter dataframe to drama messages
-    drama_df = df[df['message_id'].astype(str).isin(drama_message_ids)]
+    Args:
+        texts: Message texts; matrix rows are positions in this Series
     
-    # Simple keyword extraction (split by whitespace, remove short words)
-    all_words = []
-    for text in drama_df['text']:
-        words = text.lower().split()
-        # Filter out very short words and common stop words
-        stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him', 'her', 'us', 'them'}
-        words = [w.strip('.,!?;:()[]{}"\'-') for w in words if len(w) > 3 and w not in stop_words]
-        all_words.extend(words)
+    Returns:
+        Dict with 'vocab' (term strings) and parallel 'rows', 'terms' and
+        'counts' arrays, one entry per (message, term) pair
+    """
+    tokens = (
+        texts.reset_index(drop=True).fillna('').astype(str).str.lower()
+        .str.findall(KEYWORD_TOKEN_PATTERN).explode().dropna()
+    )
+    tokens = tokens[(tokens.str.len() >= KEYWORD_MIN_LENGTH) & ~tokens.isin(KEYWORD_STOP_WORDS)]
+    
+    terms, vocab = pd.factorize(tokens)
+    pairs, counts = np.unique(tokens.index.to_numpy(dtype=np.int64) * len(vocab) + terms, return_counts=True)
+    return {
+        'vocab': np.asarray(vocab, dtype=object),
+        'rows': pairs // max(len(vocab), 1),
+        'terms': pairs % max(len(vocab), 1),
+        'counts': counts,
+    }
+
+
+def top_terms_by_group(matrix: Dict[str, np.ndarray], groups: np.ndarray, names, top_n: int = TOP_KEYWORDS) -> Dict[str, List[str]]:
+    """
+    Top TF-IDF terms per group of messages, for all groups at once.
+    Each group is treated as one document: tf is the term count within the
+    group and idf is computed across the groups.
     
-    # Count keywords
-    word_counter = Counter(all_words)
-    top_keywords = [word for word, count in word_counter.most_common(top_n)]
+    Args:
+        matrix: Output of build_term_matrix
+        groups: Group code per matrix row (-1 excludes the message)
+        names: Group name per code
+        top_n: Terms returned per group
+    """
+    n_vocab = max(len(matrix['vocab']), 1)
+    selected = groups[matrix['rows']] >= 0
+    keys = groups[matrix['rows'][selected]] * n_vocab + matrix['terms'][selected]
+    pairs, inverse = np.unique(keys, return_inverse=True)
+    tf = np.bincount(inverse, weights=matrix['counts'][selected])
+    group, term = pairs // n_vocab, pairs % n_vocab
+    
+    # Smoothed idf over groups, as in scikit-learn's TfidfTransformer
+    doc_freq = np.bincount(term, minlength=n_vocab)
+    idf = np.log((1 + len(names)) / (1 + doc_freq)) + 1
+    score = tf * idf[term]
+    
+    # Rank terms within each group (score desc, then alphabetically, so ties
+    # don't depend on which messages the matrix was built from)
+    alphabetical = np.argsort(np.argsort(matrix['vocab'].astype(str), kind='stable'))
+    order = np.lexsort((alphabetical[term], -score, group))
+    group, term = group[order], term[order]
+    first = np.r_[True, group[1:] != group[:-1]]
+    rank = np.arange(len(group)) - np.maximum.accumulate(np.where(first, np.arange(len(group)), 0))
+    keep = rank < top_n
+    
+    keywords = {}
+    for code, word in zip(group[keep], matrix['vocab'][term[keep]]):
+        keywords.setdefault(names[code], []).append(word)
+    return keywords
+
+
+def extract_keywords(df: pd.DataFrame, drama_threads: Optional[List[Dict]] = None, top_n: int = TOP_KEYWORDS,
+                     start=None, end=None, matrix: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, List[str]]:
+    """
+    Extract top recurring keywords per chat (TF-IDF across chats).
     
-    print(f"Extracted {len(top_keywords)} top keywords")
+    Args:
+        df: Messages with chat_name, text and timestamp
+        drama_threads: Only count messages in these threads (None: all messages)
+        top_n: Keywords per chat
+        start: Inclusive lower bound on the message timestamp
+        end: Inclusive upper bound on the message timestamp
+        matrix: build_term_matrix(df['text']), reused across calls for different windows
+            (default: tokenize only the selected messages)
     
-    return top_keywords
+    Returns:
+        Dict mapping chat_name to its keywords, best first
+    """
+    print("Extracting keywords from drama threads..." if drama_threads is not None else "Extracting keywords...")
+    
+    mask = df['chat_name'].notna().to_numpy(copy=True)
+    if drama_threads is not None:
+        drama_message_ids = {m for thread in drama_threads for m in thread['message_ids']}
+        mask &= df['message_id'].astype(str).isin(drama_message_ids).to_numpy()
+    if start is not None or end is not None:
+        times = pd.to_datetime(df['timestamp'], utc=True, errors='coerce')
+        seconds = ((times - pd.Timestamp(0, tz='UTC')).dt.total_seconds()).to_numpy()
+        if start is not None:
+            mask &= seconds >= unix_seconds(start)
+        if end is not None:
+            mask &= seconds <= unix_seconds(end)
+    
+    codes, names = pd.factorize(df['chat_name'].where(mask))
+    if matrix is None:
+        # Matrix rows are then positions among the selected messages only
+        matrix = build_term_matrix(df['text'][mask])
+        codes = codes[mask]
+    keywords = top_terms_by_group(matrix, codes, names, top_n)
+    
+    print(f"Extracted keywords for {len(keywords)} chats")
+    
+    return keywords
 
 
-def generate_conversation_summaries(df: pd.DataFrame, drama_threads: List[Dict], top_keywords: List[str]) -> Dict:
+def generate_conversation_summaries(df: pd.DataFrame, drama_threads: List[Dict], keywords: Dict[str, List[str]],
+                                    bucket: str = SENTIMENT_BUCKET) -> Dict:
     """
     Step 5: Conversation Summaries
     Generate extractive summaries for each chat highlighting:
     - Most negative/dramatic threads
     - Key topics and recurring keywords
-    - Sentiment over time
+    - Sentiment over time (mean per time bucket)
+    
+    Args:
+        df: Messages with sentiment columns
+        drama_threads: Output of find_drama_threads (most dramatic first)
+        keywords: Top keywords per chat (see extract_keywords)
+        bucket: Resample frequency for sentiment_over_time
     """
     print("Generating conversation summaries...")
     
-    summaries = {}
+    chats = df[df['chat_name'].notna()]
+    sentiment = chats['sentiment_compound'].astype(np.float64)
+    
+    # Per-chat totals in one groupby
+    totals = sentiment.groupby(chats['chat_name']).agg(['size', 'mean'])
+    
+    # Sentiment over time: mean per (chat, time bucket) in one groupby, then
+    # only the most recent MAX_SENTIMENT_POINTS buckets per chat are emitted
+    times = pd.to_datetime(chats['timestamp'], utc=True, errors='coerce')
+    buckets = (
+        pd.DataFrame({'chat_name': chats['chat_name'], 'time': times, 'sentiment': sentiment})
+        .groupby(['chat_name', pd.Grouper(key='time', freq=bucket, label='left', closed='left')])['sentiment']
+        .agg(['size', 'mean'])
+    )
+    buckets = buckets[buckets['size'] > 0].groupby(level='chat_name').tail(MAX_SENTIMENT_POINTS)
+    
+    sentiment_over_time = {}
+    for (chat_name, bucket_start), size, mean in zip(buckets.index, buckets['size'], buckets['mean']):
+        sentiment_over_time.setdefault(chat_name, []).append({
+            'timestamp': bucket_start.isoformat(),
+            'sentiment': round(float(mean), 4),
+            'message_count': int(size)
+        })
+    
+    # Drama threads grouped by chat (already most dramatic first)
+    threads_by_chat = {}
+    for thread in drama_threads:
+        threads_by_chat.setdefault(thread['chat_name'], []).append(thread)
     
-    # Group by chat_name
-    for chat_name, chat_df in df.groupby('chat_name'):
-        chat_df = chat_df.sort_values('timestamp')
-        
-        # Get drama threads for this chat
-        chat_drama_threads = [t for t in drama_threads if t['chat_name'] == chat_name]
-        chat_drama_threads = sorted(chat_drama_threads, key=lambda x: x['sentiment_avg'])[:10]  # Top 10 most dramatic
-        
-        # Calculate sentiment over time (simplified - by message order)
-        sentiment_over_time = [
-            {
-                'timestamp': str(row['timestamp']),
-                'sentiment': float(row['sentiment_compound']),
-                'message_id': str(row['message_id'])
-            }
-            for _, row in chat_df.iterrows()
-        ]
-        
-        # Format drama threads for output
+    summaries = {}
+    for chat_name, size, mean in zip(totals.index, totals['size'], totals['mean']):
+        # Format drama threads for output (top 10 most dramatic)
         formatted_threads = []
-        for thread in chat_drama_threads:
+        for thread in threads_by_chat.get(chat_name, [])[:TOP_THREADS_PER_CHAT]:
             # Create a summary from the messages
             messages_text = ' '.join([m['text'][:100] for m in thread['messages'][:3]])  # First 3 messages, truncated
             summary = f"{messages_text}..." if len(messages_text) > 200 else messages_text
@@ -382,10 +1057,10 @@ def generate_conversation_summaries(df: pd.DataFrame, drama_threads: List[Dict],
         summaries[chat_name] = {
             'chat_name': chat_name,
             'top_drama_threads': formatted_threads,
-            'sentiment_over_time': sentiment_over_time[:100],  # Limit to 100 points for performance
-            'top_keywords': top_keywords,
-            'total_messages': len(chat_df),
-            'avg_sentiment': float(chat_df['sentiment_compound'].mean())
+            'sentiment_over_time': sentiment_over_time.get(chat_name, []),
+            'top_keywords': keywords.get(chat_name, []),
+            'total_messages': int(size),
+            'avg_sentiment': float(mean)
         }
     
     return summaries
@@ -393,22 +1068,40 @@ def generate_conversation_summaries(df: pd.DataFrame, drama_threads: List[Dict],
 
 def save_drama_summary(summaries: Dict):
     """
-    Save drama summary to JSON file.
+    Save drama summaries to a SQLite store keyed by chat_name (one compact
+    JSON document per chat). The file is replaced atomically, so readers
+    see either the old or the new summaries.
     """
     print(f"Saving drama summary to {DRAMA_SUMMARY_PATH}...")
     
-    # Convert to list format for JSON
-    summary_list = list(summaries.values())
+    def write(tmp: Path):
+        tmp.unlink(missing_ok=True)
+        con = sqlite3.connect(tmp)
+        try:
+            con.execute("CREATE TABLE summaries (chat_name TEXT PRIMARY KEY, summary TEXT NOT NULL)")
+            with con:
+                con.executemany(
+                    "INSERT INTO summaries (chat_name, summary) VALUES (?, ?)",
+                    ((s['chat_name'], json.dumps(s, ensure_ascii=False, separators=(',', ':'))) for s in summaries.values()),
+                )
+        finally:
+            con.close()
+    
+    _write_atomic(DRAMA_SUMMARY_PATH, write)
     
-    with open(DRAMA_SUMMARY_PATH, 'w', encoding='utf-8') as f:
-        json.dump(summary_list, f, indent=2, ensure_ascii=False)
+    # The single JSON file is superseded by the keyed store
+    LEGACY_SUMMARY_PATH.unlink(missing_ok=True)
     
-    print(f"Saved summaries for {len(summary_list)} chats")
+    print(f"Saved summaries for {len(summaries)} chats")
 
 
-def process_all():
+def process_all(rebuild_index: bool = False, index_type: Optional[str] = None):
     """
     Main processing function that runs all steps.
+    
+    Args:
+        rebuild_index: Re-embed and rebuild the FAISS index instead of updating it in place
+        index_type: FAISS index type ('flat', 'ivfpq', 'hnsw', 'sq8'); defaults to the saved one
     """
     print("=" * 60)
     print("iMessage Assistant - Local Processing")
@@ -417,12 +1110,8 @@ def process_all():
     # Step 1: Load Data
     df = load_data()
     
-    # Step 2: Generate Text Embeddings
-    embeddings, message_id_map = generate_text_embeddings(df)
-    
-    # Build and save FAISS index
-    index = build_faiss_index(embeddings, message_id_map)
-    save_embeddings(embeddings, message_id_map, index)
+    # Step 2: Generate Text Embeddings and update (or build) the FAISS index
+    update_index(df, rebuild=rebuild_index, index_type=index_type)
     
     # Step 3 (Optional): Image Embeddings
     generate_image_embeddings(df)
@@ -431,11 +1120,11 @@ def process_all():
     df = detect_drama(df)
     drama_threads = find_drama_threads(df)
     
-    # Extract keywords
-    top_keywords = extract_keywords(df, drama_threads)
+    # Extract keywords per chat
+    keywords = extract_keywords(df, drama_threads)
     
     # Step 5: Conversation Summaries
-    summaries = generate_conversation_summaries(df, drama_threads, top_keywords)
+    summaries = generate_conversation_summaries(df, drama_threads, keywords)
     save_drama_summary(summaries)
     
     print("=" * 60)
@@ -449,60 +1138,303 @@ def process_all():
 # Step 6: Query Functions for UI
 # ============================================================================
 
-def search_messages(query: str, top_k: int = 5) -> List[Dict]:
+def get_message_table() -> Dict[str, np.ndarray]:
     """
-    Search messages using semantic search.
-    
-    Args:
-        query: Search query string
-        top_k: Number of results to return
+    Message columns used by the query functions, kept in memory in file order
+    together with a message_id sort order for lookups. Reloaded only when
+    messages_cleaned.csv changes (size or mtime).
+    """
+    global _message_table, _message_table_stamp
+    
+    st = CSV_PATH.stat()
+    stamp = (st.st_size, st.st_mtime_ns)
+    if _message_table is None or _message_table_stamp != stamp:
+        df = pd.read_csv(CSV_PATH, usecols=LOOKUP_COLUMNS)
+        df = df.dropna(subset=['message_id']).drop_duplicates(subset=['message_id'])
+        df['message_id'] = df['message_id'].astype(np.int64)
+        _message_table = {column: df[column].to_numpy() for column in df.columns}
+        # Unix seconds for time-range filters (NaN where the timestamp doesn't parse)
+        times = pd.to_datetime(df['timestamp'], utc=True, errors='coerce')
+        _message_table['timestamp_unix'] = (times - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+        _message_table['order'] = np.argsort(_message_table['message_id'], kind='stable')
+        _message_table['sorted_ids'] = _message_table['message_id'][_message_table['order']]
+        _message_table_stamp = stamp
+    
+    return _message_table
+
+
+def lookup_messages(message_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Binary-search message_ids in the resident message table.
     
     Returns:
-        List of dictionaries with message_id, text, sender, timestamp, chat_name
+        (row positions, found mask); positions are only valid where found
+    """
+    table = get_message_table()
+    ids = table['sorted_ids']
+    message_ids = np.asarray(message_ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.zeros(len(message_ids), dtype=np.intp), np.zeros(len(message_ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(ids, message_ids), len(ids) - 1)
+    found = ids[positions] == message_ids
+    return table['order'][positions], found
+
+
+def message_results(message_ids: np.ndarray, scores: np.ndarray) -> List[Dict]:
     """
-    global _text_model, _faiss_index, _message_id_map, _embeddings_array
+    Result dicts for FAISS hits (message_ids, -1 for empty slots), in hit order.
+    """
+    table = get_message_table()
+    keep = message_ids >= 0
+    message_ids, scores = message_ids[keep], scores[keep]
+    positions, found = lookup_messages(message_ids)
     
-    # Load model and index if not already loaded
-    if _text_model is None:
-        _text_model = SentenceTransformer('all-MiniLM-L6-v2')
+    results = []
+    for pos, score in zip(positions[found], scores[found]):
+        results.append({
+            'message_id': str(table['message_id'][pos]),
+            'text': str(table['text'][pos]),
+            'sender': str(table['sender'][pos]),
+            'timestamp': str(table['timestamp'][pos]),
+            'chat_name': str(table['chat_name'][pos]),
+            'similarity_score': float(score)
+        })
+    return results
+
+
+def get_faiss_index() -> faiss.Index:
+    """
+    The FAISS index, loaded (memory-mapped) once per process and reloaded when
+    another process saves a new one.
+    """
+    if _faiss_index is not None and INDEX_META_PATH.exists():
+        if INDEX_META_PATH.stat().st_mtime_ns != _index_stamp:
+            reset_embeddings()
     
     if _faiss_index is None:
-        _faiss_index, _message_id_map, _embeddings_array = load_embeddings()
+        load_embeddings()
         
         if _faiss_index is None:
             raise ValueError("FAISS index not found. Please run process_all() first.")
     
-    # Load original dataframe to get message details
-    df = pd.read_csv(CSV_PATH)
+    return _faiss_index
+
+
+def unix_seconds(t) -> float:
+    """
+    Unix seconds from a number (including NumPy scalars) or anything pd.Timestamp accepts (naive = UTC).
+    """
+    if isinstance(t, numbers.Real):
+        return float(t)
+    ts = pd.Timestamp(t)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize('UTC')
+    return ts.timestamp()
+
+
+def build_scope_index(id_map: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Precompute filter scopes over embedding rows (aligned with id_map):
+    rows grouped by chat (CSR offsets) and sorted by time within each chat,
+    plus all rows sorted by time. Any chat / time-range scope is then a few
+    binary searches.
+    """
+    table = get_message_table()
+    positions, found = lookup_messages(id_map['message_id'])
+    chats = pd.Series(np.where(found, table['chat_name'][positions], None), dtype=object).fillna('').astype(str)
+    times = np.where(found, table['timestamp_unix'][positions], np.nan)
+    
+    codes, names = pd.factorize(chats)
+    chat_rows = np.lexsort((times, codes))
+    time_rows = np.argsort(times, kind='stable')
+    return {
+        'chat_names': np.asarray(names, dtype=str),
+        'chat_offsets': np.searchsorted(codes[chat_rows], np.arange(len(names) + 1)),
+        'chat_rows': chat_rows,
+        'chat_times': times[chat_rows],
+        'time_rows': time_rows,
+        'times': times[time_rows],
+    }
+
+
+def get_scope_index() -> Dict[str, np.ndarray]:
+    """
+    The saved scope index (rebuilt from the id map if it predates this file).
+    """
+    global _scope_index
     
-    # Embed query
-    query_embedding = _text_model.encode([query], convert_to_numpy=True)
-    faiss.normalize_L2(query_embedding)
+    if _scope_index is None:
+        _scope_index = load_scopes()
+        if _scope_index is None:
+            _scope_index = build_scope_index(_message_id_map)
+            save_scopes(_scope_index)
     
-    # Search FAISS index
-    distances, indices = _faiss_index.search(query_embedding.astype('float32'), top_k)
+    return _scope_index
+
+
+def _time_range(times: np.ndarray, start, end) -> slice:
+    lo = 0 if start is None else np.searchsorted(times, unix_seconds(start), side='left')
+    hi = len(times) if end is None else np.searchsorted(times, unix_seconds(end), side='right')
+    return slice(lo, hi)
+
+
+def scope_rows(chat_name=None, start=None, end=None) -> Optional[np.ndarray]:
+    """
+    Embedding rows matching the chat / time filters, or None when unfiltered.
     
-    # Get results
-    results = []
-    for idx, dist in zip(indices[0], distances[0]):
-        if idx < 0:  # Invalid index
-            continue
-        
-        message_id = _message_id_map.get(idx)
-        if message_id:
-            message_row = df[df['message_id'].astype(str) == message_id]
-            if not message_row.empty:
-                row = message_row.iloc[0]
-                results.append({
-                    'message_id': str(row['message_id']),
-                    'text': str(row['text']),
-                    'sender': str(row['sender']),
-                    'timestamp': str(row['timestamp']),
-                    'chat_name': str(row['chat_name']),
-                    'similarity_score': float(dist)
-                })
+    Args:
+        chat_name: Chat name or list of chat names
+        start: Inclusive lower bound on the message timestamp
+        end: Inclusive upper bound on the message timestamp
+    """
+    if chat_name is None and start is None and end is None:
+        return None
     
-    return results
+    scopes = get_scope_index()
+    if chat_name is None:
+        return scopes['time_rows'][_time_range(scopes['times'], start, end)]
+    
+    names = [chat_name] if isinstance(chat_name, str) else list(chat_name)
+    codes = np.flatnonzero(np.isin(scopes['chat_names'], names))
+    offsets = scopes['chat_offsets']
+    parts = []
+    for code in codes:
+        lo, hi = offsets[code], offsets[code + 1]
+        window = _time_range(scopes['chat_times'][lo:hi], start, end)
+        parts.append(scopes['chat_rows'][lo:hi][window])
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+
+def exact_search(query_embeddings: np.ndarray, rows: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Brute-force inner-product search over the given embedding rows only.
+    Always fills top_k (when the scope has that many messages).
+    
+    Returns:
+        (scores, message_ids) shaped like faiss search output, padded with -1
+    """
+    rows = np.sort(rows)
+    vectors = _embeddings_array[rows]
+    ids = _message_id_map['message_id'][rows]
+    scores = query_embeddings @ vectors.T
+    
+    k = min(top_k, len(rows))
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    best, best_scores = np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+    
+    distances = np.full((len(query_embeddings), top_k), -np.inf, dtype=np.float32)
+    labels = np.full((len(query_embeddings), top_k), -1, dtype=np.int64)
+    distances[:, :k], labels[:, :k] = best_scores, ids[best]
+    return distances, labels
+
+
+def scope_selector(rows: np.ndarray) -> Tuple[faiss.IDSelector, np.ndarray]:
+    """
+    IDSelectorBitmap over the message_ids of the given rows.
+    The bitmap is returned too and must stay alive for the duration of the search.
+    """
+    ids = _message_id_map['message_id'][rows]
+    mask = np.zeros(int(ids.max()) + 1, dtype=bool)
+    mask[ids] = True
+    bitmap = np.packbits(mask, bitorder='little')
+    return faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap)), bitmap
+
+
+def search_messages_batch(queries: List[str], top_k: int = 5, chat_name=None, start=None, end=None,
+                          nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[List[Dict]]:
+    """
+    Search many queries at once: one encode call and one FAISS search over the
+    whole query matrix.
+    
+    Args:
+        queries: Search query strings
+        top_k: Number of results to return per query
+        chat_name: Only search these chats (name or list of names)
+        start: Only search messages at or after this time
+        end: Only search messages at or before this time
+        nprobe: IVF lists scanned per query (IVF-PQ indexes; default NPROBE)
+        ef_search: HNSW candidate list size (HNSW indexes; default EF_SEARCH)
+    
+    Returns:
+        One result list per query, in query order (see search_messages)
+    """
+    if not queries:
+        return []
+    
+    index = get_faiss_index()
+    
+    # Embedding rows in the requested scope (precomputed chat / time ranges)
+    rows = scope_rows(chat_name, start, end)
+    if rows is not None and len(rows) == 0:
+        return [[] for _ in queries]
+    
+    # Embed all queries in one call
+    query_embeddings = get_text_model().encode(queries, convert_to_numpy=True).astype('float32')
+    faiss.normalize_L2(query_embeddings)
+    
+    if rows is not None and len(rows) <= EXACT_SCOPE_MAX and _embeddings_array is not None:
+        # Small scopes: exact search over just those vectors
+        distances, indices = exact_search(query_embeddings, rows, top_k)
+    else:
+        # Search FAISS index, restricted to the scope's message_ids when filtered
+        # (bitmap backs the selector and must outlive the search)
+        selector, bitmap = scope_selector(rows) if rows is not None else (None, None)
+        params = search_params(index, nprobe=nprobe, ef_search=ef_search, sel=selector)
+        distances, indices = index.search(query_embeddings, top_k, params=params)
+    
+    # Get results (details come from the resident message table)
+    return [message_results(indices[i], distances[i]) for i in range(len(queries))]
+
+
+def search_messages(query: str, top_k: int = 5, chat_name=None, start=None, end=None,
+                    nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> List[Dict]:
+    """
+    Search messages using semantic search.
+    
+    Args:
+        query: Search query string
+        top_k: Number of results to return
+        chat_name: Only search these chats (name or list of names)
+        start: Only search messages at or after this time
+        end: Only search messages at or before this time
+        nprobe: IVF lists scanned per query (IVF-PQ indexes; default NPROBE)
+        ef_search: HNSW candidate list size (HNSW indexes; default EF_SEARCH)
+    
+    Returns:
+        List of dictionaries with message_id, text, sender, timestamp, chat_name
+    """
+    return search_messages_batch(
+        [query], top_k, chat_name=chat_name, start=start, end=end, nprobe=nprobe, ef_search=ef_search,
+    )[0]
+
+
+def get_drama_store() -> Optional[sqlite3.Connection]:
+    """
+    Read-only connection to the drama summary store, or None if it doesn't
+    exist. Reopened (and the in-memory summary cache cleared) when the file
+    is replaced (size, mtime or inode change).
+    """
+    global _drama_store, _drama_store_stamp, _drama_summaries, _drama_chat_names
+    
+    if not DRAMA_SUMMARY_PATH.exists():
+        stamp = None
+    else:
+        st = DRAMA_SUMMARY_PATH.stat()
+        stamp = (st.st_size, st.st_mtime_ns, st.st_ino)
+    
+    if stamp != _drama_store_stamp:
+        if _drama_store is not None:
+            _drama_store.close()
+        _drama_store = None
+        if stamp is not None:
+            _drama_store = sqlite3.connect(f"{DRAMA_SUMMARY_PATH.as_uri()}?mode=ro", uri=True, check_same_thread=False)
+        _drama_store_stamp = stamp
+        _drama_summaries = {}
+        _drama_chat_names = None
+    
+    return _drama_store
 
 
 def get_drama_summary(chat_name: str) -> Optional[Dict]:
@@ -515,33 +1447,33 @@ def get_drama_summary(chat_name: str) -> Optional[Dict]:
     Returns:
         Dictionary with top drama threads, sentiment timeline, and keywords
     """
-    if not DRAMA_SUMMARY_PATH.exists():
+    store = get_drama_store()
+    if store is None:
         raise ValueError("Drama summary not found. Please run process_all() first.")
     
-    with open(DRAMA_SUMMARY_PATH, 'r', encoding='utf-8') as f:
-        summaries = json.load(f)
-    
-    # Find summary for this chat
-    for summary in summaries:
-        if summary['chat_name'] == chat_name:
-            return summary
+    # Primary-key lookup, parsed once per store version
+    if chat_name not in _drama_summaries:
+        row = store.execute("SELECT summary FROM summaries WHERE chat_name = ?", (chat_name,)).fetchone()
+        _drama_summaries[chat_name] = json.loads(row[0]) if row else None
     
-    return None
+    return _drama_summaries[chat_name]
 
 
 def get_all_chat_names() -> List[str]:
     """
     Get list of all chat names from the drama summary.
     """
-    if not DRAMA_SUMMARY_PATH.exists():
-        # Fallback to CSV if summary doesn't exist
-        df = pd.read_csv(CSV_PATH)
-        return df['chat_name'].unique().tolist()
+    global _drama_chat_names
+    
+    store = get_drama_store()
+    if store is None:
+        # Fallback to the message table if summary doesn't exist
+        return pd.unique(get_message_table()['chat_name']).tolist()
     
-    with open(DRAMA_SUMMARY_PATH, 'r', encoding='utf-8') as f:
-        summaries = json.load(f)
+    if _drama_chat_names is None:
+        _drama_chat_names = [name for (name,) in store.execute("SELECT chat_name FROM summaries ORDER BY rowid")]
     
-    return [s['chat_name'] for s in summaries]
+    return list(_drama_chat_names)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
-import re, sqlite3, sys, plistlib
+import argparse, ctypes, os, re, shutil, sqlite3, sys, time, plistlib
+from collections import Counter, deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 BASE = Path(__file__).resolve().parent.parent
@@ -14,8 +17,15 @@ VCF = INPUT / "contacts.vcf"
 
 WORK_DB = WORK / "chat.db"
 OUT_DB = DATA / "processed.db"
+TMP_DB = DATA / "processed.db.tmp"
 
 APPLE_EPOCH = 978307200  # 2001-01-01
+DECODE_CHUNK = 2000      # message rows per attributedBody decode task
+DECODE_POOL_MIN = 20000  # below this many blobs to decode, decode in-process
+BACKUP_PAGES = 4096      # pages per online-backup step
+COPY_BUFFER = 16 << 20   # bytes per read for the plain-copy fallback
+FICLONE = 0x40049409     # Linux reflink ioctl
+BULK_CACHE_KIB = 512 * 1024  # page cache while building processed.db
 
 def norm_handle(s):
     if not s: return ""
@@ -52,16 +62,7 @@ def parse_vcf(text):
 
     return contacts
 
-def extract_text_from_attributed_body(blob):
-    """
-    attributedBody is usually an NSKeyedArchiver plist blob.
-    We try to parse it, then harvest all strings from $objects.
-    Fallback: heuristic string extraction from bytes.
-    """
-    if not blob:
-        return ""
-
-    # 1) Try plistlib (often works on modern macOS)
+def _plist_text(blob):
     try:
         obj = plistlib.loads(blob)
         strings = []
@@ -89,13 +90,12 @@ def extract_text_from_attributed_body(blob):
             cleaned.append(s)
 
         # If we got something that looks like real text, return it
-        joined = " ".join(cleaned).strip()
-        if joined:
-            return joined
+        return " ".join(cleaned).strip()
     except Exception:
-        pass
+        return ""
 
-    # 2) Fallback: pull readable ASCII/UTF-8-ish runs from bytes
+def _heuristic_text(blob):
+    # Fallback: pull readable ASCII/UTF-8-ish runs from bytes
     try:
         text = blob.decode("utf-8", errors="ignore")
     except Exception:
@@ -114,76 +114,220 @@ def extract_text_from_attributed_body(blob):
     cleaned_text = re.sub(r'^[^A-Za-z]+', '', cleaned_text)
     return cleaned_text
 
-def main():
-    if not CHAT_DB.exists():
-        print("❌ Missing input/chat.db"); sys.exit(1)
+TYPEDSTREAM_MAGIC = b"\x04\x0bstreamtyped"
 
-    WORK.mkdir(exist_ok=True)
-    DATA.mkdir(exist_ok=True)
+def decode_typedstream_text(blob):
+    """
+    Read the NSString payload of an NSArchiver (streamtyped) attributedBody
+    without decoding the rest of the archive. Returns None if the blob does
+    not have the expected layout.
+
+    After the NSString (or NSMutableString -> NSString) class header the
+    string is written as type "+" followed by a length and the UTF-8 bytes.
+    Lengths below 0x80 are a single byte; 0x81 / 0x82 prefix a little-endian
+    int16 / int32.
+    """
+    if not blob.startswith(TYPEDSTREAM_MAGIC):
+        return None
+    i = blob.find(b"NSString")
+    if i < 0:
+        return None
+    j = blob.find(b"\x84\x01+", i + 8, i + 24)
+    if j < 0:
+        return None
+    k = j + 3
+    if k >= len(blob):
+        return None
+
+    n = blob[k]
+    k += 1
+    if n == 0x81:
+        n = int.from_bytes(blob[k:k + 2], "little", signed=True)
+        k += 2
+    elif n == 0x82:
+        n = int.from_bytes(blob[k:k + 4], "little", signed=True)
+        k += 4
+    elif n >= 0x80:
+        return None
+
+    payload = blob[k:k + n]
+    if n < 0 or len(payload) != n:
+        return None
+    try:
+        return payload.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+def decode_attributed_body(blob):
+    """Return (text, path) where path is "typedstream", "plist" or "heuristic"."""
+    if not blob:
+        return "", "heuristic"
 
-    # Copy into work/ to avoid locks + include WAL/SHM
-    WORK_DB.write_bytes(CHAT_DB.read_bytes())
-    if WAL.exists(): (WORK / "chat.db-wal").write_bytes(WAL.read_bytes())
-    if SHM.exists(): (WORK / "chat.db-shm").write_bytes(SHM.read_bytes())
+    # 1) Native typedstream read (the format nearly all rows use)
+    text = decode_typedstream_text(blob)
+    if text is not None:
+        return text, "typedstream"
 
-    contacts = {}
+    # 2) plistlib for NSKeyedArchiver blobs
+    text = _plist_text(blob)
+    if text:
+        return text, "plist"
+
+    # 3) Heuristic string scraping
+    return _heuristic_text(blob), "heuristic"
+
+def extract_text_from_attributed_body(blob):
+    """
+    attributedBody is usually an NSArchiver typedstream; read its NSString
+    directly. Older NSKeyedArchiver plists have their strings harvested from
+    $objects. Fallback: heuristic string extraction from bytes.
+    """
+    return decode_attributed_body(blob)[0]
+
+SCHEMA = """
+CREATE TABLE contacts(
+  handle TEXT PRIMARY KEY,
+  name TEXT NOT NULL
+);
+
+CREATE TABLE threads(
+  chat_id INTEGER PRIMARY KEY,
+  title TEXT,
+  last_message_at TEXT,
+  message_count INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE thread_members(
+  chat_id INTEGER,
+  member_handle TEXT,
+  member_name TEXT
+);
+
+CREATE TABLE messages(
+  message_id INTEGER PRIMARY KEY,
+  chat_id INTEGER,
+  sent_at TEXT,
+  sender_name TEXT,
+  text TEXT
+);
+
+-- high-water marks per chat for incremental imports (raw chat.db values)
+CREATE TABLE import_state(
+  chat_id INTEGER PRIMARY KEY,
+  max_rowid INTEGER NOT NULL,
+  max_date INTEGER NOT NULL
+);
+
+-- full-text index over messages.text (external content, filled after load)
+CREATE VIRTUAL TABLE messages_fts USING fts5(
+  text,
+  content='messages',
+  content_rowid='message_id',
+  tokenize='unicode61 remove_diacritics 2',
+  prefix='2 3'
+);
+"""
+
+# created after the bulk load so rows are not indexed one at a time
+INDEXES = """
+CREATE INDEX idx_thread_members_chat ON thread_members(chat_id);
+CREATE INDEX idx_messages_chat_time ON messages(chat_id, sent_at);
+"""
+
+# keep messages_fts in sync with later (incremental) writes to messages
+FTS_TRIGGERS = """
+CREATE TRIGGER messages_fts_ai AFTER INSERT ON messages BEGIN
+  INSERT INTO messages_fts(rowid, text) VALUES (new.message_id, new.text);
+END;
+CREATE TRIGGER messages_fts_ad AFTER DELETE ON messages BEGIN
+  INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.message_id, old.text);
+END;
+CREATE TRIGGER messages_fts_au AFTER UPDATE ON messages BEGIN
+  INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.message_id, old.text);
+  INSERT INTO messages_fts(rowid, text) VALUES (new.message_id, new.text);
+END;
+"""
+
+def reflink(src, dst):
+    """Copy-on-write clone of src to dst; raises OSError where unsupported."""
+    if sys.platform == "darwin":
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+    else:
+        import fcntl
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+def backup_copy(src, dst):
+    """Page-by-page online backup; folds the WAL into dst and keeps memory flat."""
+    s = sqlite3.connect(f"{src.as_uri()}?mode=ro", uri=True)
+    d = sqlite3.connect(str(dst))
+    try:
+        s.backup(d, pages=BACKUP_PAGES)
+    finally:
+        d.close()
+        s.close()
+
+def stream_copy(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        shutil.copyfileobj(s, d, COPY_BUFFER)
+        d.flush()
+        os.fsync(d.fileno())
+
+def snapshot_chat_db():
+    """
+    Snapshot chat.db (+ WAL/SHM) into work/ to avoid locks, without reading
+    it into memory: reflink where the filesystem supports it, else SQLite's
+    online backup, else a chunked copy.
+    """
+    files = [(CHAT_DB, WORK_DB), (WAL, WORK / "chat.db-wal"), (SHM, WORK / "chat.db-shm")]
+    for _, dst in files:
+        if dst.exists(): dst.unlink()
+
+    try:
+        for src, dst in files:
+            if src.exists(): reflink(src, dst)
+        print("Snapshot: reflink")
+        return
+    except (OSError, ImportError, AttributeError):
+        for _, dst in files:
+            if dst.exists(): dst.unlink()
+
+    try:
+        backup_copy(CHAT_DB, WORK_DB)
+        print("Snapshot: sqlite backup")
+        return
+    except sqlite3.Error:
+        if WORK_DB.exists(): WORK_DB.unlink()
+
+    for src, dst in files:
+        if src.exists(): stream_copy(src, dst)
+    print("Snapshot: copy")
+
+def load_contacts(out):
+    """Upsert contacts.vcf into out and return handle -> name."""
     if VCF.exists():
         contacts = parse_vcf(VCF.read_text(errors="ignore"))
         print(f"Loaded contacts: {len(contacts)}")
+        out.executemany("INSERT OR REPLACE INTO contacts VALUES (?,?)", contacts.items())
     else:
         print("No contacts.vcf found")
+    return {h: n for h, n in out.execute("SELECT handle, name FROM contacts")}
 
-    if OUT_DB.exists(): OUT_DB.unlink()
+def has_column(src, table, column):
+    return any(r["name"] == column for r in src.execute(f"PRAGMA table_info({table})"))
 
-    src = sqlite3.connect(str(WORK_DB))
-    src.row_factory = sqlite3.Row
-    out = sqlite3.connect(str(OUT_DB))
-
-    out.executescript("""
-    PRAGMA journal_mode=WAL;
-
-    CREATE TABLE contacts(
-      handle TEXT PRIMARY KEY,
-      name TEXT NOT NULL
-    );
-
-    CREATE TABLE threads(
-      chat_id INTEGER PRIMARY KEY,
-      title TEXT,
-      last_message_at TEXT
-    );
-
-    CREATE TABLE thread_members(
-      chat_id INTEGER,
-      member_handle TEXT,
-      member_name TEXT
-    );
-    CREATE INDEX idx_thread_members_chat ON thread_members(chat_id);
-
-    CREATE TABLE messages(
-      message_id INTEGER PRIMARY KEY,
-      chat_id INTEGER,
-      sent_at TEXT,
-      sender_name TEXT,
-      text TEXT
-    );
-    CREATE INDEX idx_messages_chat_time ON messages(chat_id, sent_at);
-    """)
-
-    out.executemany("INSERT OR IGNORE INTO contacts VALUES (?,?)", contacts.items())
-    out.commit()
-    name_map = {h: n for h, n in out.execute("SELECT handle, name FROM contacts")}
-
-    def name_for(handle):
-        h = norm_handle(handle)
-        return name_map.get(h, h)
-
-    # members
+def import_members(src, out, name_for, chat_ids=None):
+    """(Re)write thread_members for chat_ids (all chats if None); return chat_id -> handles."""
+    scope = "WHERE chj.chat_id IN (SELECT chat_id FROM temp.scope)" if chat_ids is not None else ""
     members_by_chat = {}
-    for r in src.execute("""
+    for r in src.execute(f"""
       SELECT chj.chat_id, h.id AS handle
       FROM chat_handle_join chj
       JOIN handle h ON h.ROWID = chj.handle_id
+      {scope}
       ORDER BY chj.chat_id
     """):
         cid = r["chat_id"]
@@ -191,19 +335,25 @@ def main():
         if h:
             members_by_chat.setdefault(cid, []).append(h)
 
+    if chat_ids is not None:
+        out.executemany("DELETE FROM thread_members WHERE chat_id = ?", [(cid,) for cid in chat_ids])
+
     batch = []
     for cid, handles in members_by_chat.items():
         for h in handles:
             batch.append((cid, h, name_for(h)))
     out.executemany("INSERT INTO thread_members(chat_id, member_handle, member_name) VALUES (?,?,?)", batch)
-    out.commit()
+    return members_by_chat
 
-    # threads
+def import_threads(src, out, name_for, members_by_chat, chat_ids=None):
+    """Insert or update threads (title, last_message_at) for chat_ids (all chats if None)."""
+    scope = "WHERE cmj.chat_id IN (SELECT chat_id FROM temp.scope)" if chat_ids is not None else ""
     chats = src.execute(f"""
       WITH latest AS (
         SELECT cmj.chat_id, MAX(m.date) AS max_date
         FROM chat_message_join cmj
         JOIN message m ON m.ROWID = cmj.message_id
+        {scope}
         GROUP BY cmj.chat_id
       )
       SELECT
@@ -216,6 +366,7 @@ def main():
       ORDER BY l.max_date DESC
     """).fetchall()
 
+    rows = []
     for c in chats:
         cid = c["chat_id"]
         display = (c["display_name"] or "").strip()
@@ -229,9 +380,109 @@ def main():
             parts = [name_for(h) for h in members_by_chat.get(cid, [])]
             title = ", ".join(parts[:5]) if parts else (ident or f"chat_{cid}")
 
-        out.execute("INSERT INTO threads(chat_id, title, last_message_at) VALUES (?,?,?)",
-                    (cid, title, c["last_message_at"]))
-    out.commit()
+        rows.append((cid, title, c["last_message_at"]))
+
+    out.executemany("""
+      INSERT INTO threads(chat_id, title, last_message_at) VALUES (?,?,?)
+      ON CONFLICT(chat_id) DO UPDATE SET
+        title = excluded.title,
+        last_message_at = excluded.last_message_at
+    """, rows)
+    return len(rows)
+
+def update_message_counts(out, chat_ids=None):
+    """Recount threads.message_count for chat_ids (all chats if None) from idx_messages_chat_time."""
+    if chat_ids is None:
+        chat_ids = [cid for (cid,) in out.execute("SELECT chat_id FROM threads")]
+    out.executemany(
+        "UPDATE threads SET message_count = (SELECT COUNT(*) FROM messages WHERE chat_id = ?) WHERE chat_id = ?",
+        [(cid, cid) for cid in chat_ids],
+    )
+
+def ensure_message_counts(out):
+    """Add and fill threads.message_count in a processed.db built before the column existed."""
+    columns = {row[1] for row in out.execute("PRAGMA table_info(threads)")}
+    if "message_count" not in columns:
+        out.execute("ALTER TABLE threads ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+        update_message_counts(out)
+
+def decode_blobs(blobs):
+    """Decode a chunk of blobs; returns (texts, Counter of decode paths)."""
+    texts, paths = [], Counter()
+    for b in blobs:
+        text, path = decode_attributed_body(b)
+        texts.append(text)
+        paths[path] += 1
+    return texts, paths
+
+def iter_message_texts(msg_rows, workers=1, stats=None):
+    """
+    Yield (row, text) in source order. Rows are read in chunks; rows with no
+    plain text have their attributedBody decoded on a process pool while the
+    caller writes earlier chunks. The pool is only started once at least
+    DECODE_POOL_MIN blobs are pending; smaller runs (typical incremental
+    imports) decode in-process. Decode paths are tallied into `stats`.
+    """
+    stats = Counter() if stats is None else stats
+
+    def blobs_of(rows):
+        return [r["attributed_body"] for r in rows if not r["text"] and r["attributed_body"]]
+
+    def merge(rows, decoded):
+        texts, paths = decoded
+        stats.update(paths)
+        decoded = iter(texts)
+        for r in rows:
+            text = r["text"]
+            if not text and r["attributed_body"]:
+                text = next(decoded)
+            yield r, text or ""
+
+    chunks = iter(lambda: msg_rows.fetchmany(DECODE_CHUNK), [])
+    if workers > 1:
+        # read ahead until there is enough to decode to pay for pool startup
+        head, pending_blobs = [], 0
+        for rows in chunks:
+            head.append(rows)
+            pending_blobs += len(blobs_of(rows))
+            if pending_blobs >= DECODE_POOL_MIN:
+                break
+        else:
+            workers = 1
+        chunks = chain(head, chunks)
+
+    if workers <= 1:
+        for rows in chunks:
+            yield from merge(rows, decode_blobs(blobs_of(rows)))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for rows in chunks:
+            pending.append((rows, pool.submit(decode_blobs, blobs_of(rows))))
+            # bounded read-ahead keeps memory flat and results in order
+            if len(pending) >= workers * 2:
+                rows, decoded = pending.popleft()
+                yield from merge(rows, decoded.result())
+        while pending:
+            rows, decoded = pending.popleft()
+            yield from merge(rows, decoded.result())
+
+def import_messages(src, out, name_for, since=None, workers=1):
+    """
+    Copy messages into out. With `since` (chat_id -> (max_rowid, max_date)),
+    only rows past a chat's high-water mark, or edited after it, are read.
+    Returns chat_id -> (max_rowid, max_date) over the rows written.
+    """
+    edited = "COALESCE(m.date_edited, 0)" if has_column(src, "message", "date_edited") else "0"
+    scope = ""
+    if since is not None:
+        src.execute("CREATE TEMP TABLE hw(chat_id INTEGER PRIMARY KEY, max_rowid INTEGER, max_date INTEGER)")
+        src.executemany("INSERT INTO temp.hw VALUES (?,?,?)", [(c, r, d) for c, (r, d) in since.items()])
+        scope = f"""
+      LEFT JOIN temp.hw ON hw.chat_id = cmj.chat_id
+      WHERE hw.chat_id IS NULL OR m.ROWID > hw.max_rowid OR {edited} > hw.max_date
+        """
 
     # messages (IMPORTANT: pull attributedBody too)
     msg_rows = src.execute(f"""
@@ -239,6 +490,7 @@ def main():
         m.ROWID AS message_id,
         cmj.chat_id AS chat_id,
         datetime(m.date/1000000000 + {APPLE_EPOCH}, 'unixepoch','localtime') AS sent_at,
+        MAX(m.date, {edited}) AS raw_date,
         m.is_from_me,
         h.id AS handle,
         m.text AS text,
@@ -246,35 +498,216 @@ def main():
       FROM message m
       JOIN chat_message_join cmj ON cmj.message_id = m.ROWID
       LEFT JOIN handle h ON h.ROWID = m.handle_id
+      {scope}
     """)
 
+    upsert = """
+      INSERT INTO messages VALUES (?,?,?,?,?)
+      ON CONFLICT(message_id) DO UPDATE SET
+        chat_id = excluded.chat_id,
+        sent_at = excluded.sent_at,
+        sender_name = excluded.sender_name,
+        text = excluded.text
+    """
+    started = time.perf_counter()
+    written = 0
+    high_water = {}
+    decode_stats = Counter()
     batch = []
-    for r in msg_rows:
+    for r, text in iter_message_texts(msg_rows, workers, decode_stats):
         if r["is_from_me"] == 1:
             sender = "ME"
         else:
             sender = name_for(r["handle"]) if r["handle"] else "UNKNOWN"
 
-        text = r["text"]
-        if not text and r["attributed_body"]:
-            text = extract_text_from_attributed_body(r["attributed_body"])
-        if not text:
-            text = ""
-
         batch.append((r["message_id"], r["chat_id"], r["sent_at"], sender, text))
 
+        cid = r["chat_id"]
+        max_rowid, max_date = high_water.get(cid, (0, 0))
+        high_water[cid] = (max(max_rowid, r["message_id"]), max(max_date, r["raw_date"] or 0))
+
         if len(batch) >= 5000:
-            out.executemany("INSERT OR REPLACE INTO messages VALUES (?,?,?,?,?)", batch)
-            out.commit()
+            out.executemany(upsert, batch)
+            written += len(batch)
             batch.clear()
 
     if batch:
-        out.executemany("INSERT OR REPLACE INTO messages VALUES (?,?,?,?,?)", batch)
-        out.commit()
+        out.executemany(upsert, batch)
+        written += len(batch)
+
+    elapsed = time.perf_counter() - started
+    print(f"Wrote {written} messages in {elapsed:.1f}s ({written / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    if decode_stats:
+        print(f"Decoded {sum(decode_stats.values())} attributedBody blobs "
+              f"(typedstream: {decode_stats['typedstream']}, plist: {decode_stats['plist']}, "
+              f"heuristic fallback: {decode_stats['heuristic']})")
+    return high_water
+
+def save_import_state(out, high_water):
+    out.executemany("""
+      INSERT INTO import_state(chat_id, max_rowid, max_date) VALUES (?,?,?)
+      ON CONFLICT(chat_id) DO UPDATE SET
+        max_rowid = MAX(max_rowid, excluded.max_rowid),
+        max_date = MAX(max_date, excluded.max_date)
+    """, [(cid, r, d) for cid, (r, d) in high_water.items()])
+
+def fsync_path(path):
+    """Flush a file or directory to stable storage (F_FULLFSYNC on macOS, where fsync alone may not)."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        if sys.platform == "darwin":
+            import fcntl
+            fcntl.fcntl(fd, fcntl.F_FULLFSYNC)
+        else:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
 
-    src.close()
+def retire_wal(db):
+    """
+    Fold db's WAL (if any) back into it and drop the -wal/-shm sidecars.
+
+    processed.db used to be built in WAL mode. Its sidecars belong to the old
+    file and would be replayed over a new file renamed into its place, so
+    they must not outlive the swap. Switching to journal_mode=DELETE removes
+    them and stops new connections from recreating them; if open readers
+    prevent that, checkpoint and delete them directly.
+    """
+    if db.exists():
+        con = sqlite3.connect(str(db), timeout=5)
+        try:
+            con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            con.execute("PRAGMA journal_mode=DELETE")
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            con.close()
+    for suffix in ("-wal", "-shm"):
+        db.with_name(db.name + suffix).unlink(missing_ok=True)
+
+def name_resolver(name_map):
+    def name_for(handle):
+        h = norm_handle(handle)
+        return name_map.get(h, h)
+    return name_for
+
+def full_import(src, workers=1):
+    """
+    Bulk-load a fresh processed.db next to the old one, then swap it in
+    atomically. The temp file is thrown away on failure, so it is built
+    with no journal, no fsyncs and a single transaction; it is flushed once,
+    before the swap, so a crash can never leave a torn processed.db.
+    """
+    for p in (TMP_DB, TMP_DB.with_name(TMP_DB.name + "-journal")):
+        if p.exists(): p.unlink()
+
+    started = time.perf_counter()
+    out = sqlite3.connect(str(TMP_DB), isolation_level=None)
+    out.executescript(f"""
+    PRAGMA journal_mode=OFF;
+    PRAGMA synchronous=OFF;
+    PRAGMA locking_mode=EXCLUSIVE;
+    PRAGMA temp_store=MEMORY;
+    PRAGMA cache_size=-{BULK_CACHE_KIB};
+    """)
+    out.executescript(SCHEMA)
+
+    out.execute("BEGIN")
+    name_for = name_resolver(load_contacts(out))
+    members_by_chat = import_members(src, out, name_for)
+    import_threads(src, out, name_for, members_by_chat)
+    high_water = import_messages(src, out, name_for, workers=workers)
+    save_import_state(out, high_water)
+    out.execute("COMMIT")
+
+    out.executescript(INDEXES)
+    update_message_counts(out)
+    # full-text index (one pass over messages, much faster than per-row inserts)
+    out.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    out.execute("INSERT INTO messages_fts(messages_fts) VALUES ('optimize')")
+    out.executescript(FTS_TRIGGERS)
+    out.execute("ANALYZE")
     out.close()
+
+    # Rollback-journal mode: a single file that can be renamed over the old DB
+    # while API readers still have it open. Flush its contents before the
+    # rename and the directory entry after it. A processed.db from before this
+    # layout is in WAL mode; its -wal/-shm are retired first so SQLite never
+    # replays them over the new file (and again after the swap, in case a
+    # reader of the old file recreated them in between).
+    fsync_path(TMP_DB)
+    retire_wal(OUT_DB)
+    os.replace(TMP_DB, OUT_DB)
+    for suffix in ("-wal", "-shm"):
+        OUT_DB.with_name(OUT_DB.name + suffix).unlink(missing_ok=True)
+    fsync_path(DATA)
+    print(f"Imported {len(high_water)} chats in {time.perf_counter() - started:.1f}s")
+
+def incremental_import(src, workers=1):
+    """Apply new and edited messages to processed.db in one transaction."""
+    out = sqlite3.connect(str(OUT_DB), isolation_level=None, timeout=30)
+    out.execute("BEGIN IMMEDIATE")
+    try:
+        ensure_message_counts(out)
+        since = {cid: (r, d) for cid, r, d in out.execute("SELECT chat_id, max_rowid, max_date FROM import_state")}
+        name_for = name_resolver(load_contacts(out))
+
+        high_water = import_messages(src, out, name_for, since=since, workers=workers)
+        touched = sorted(high_water)
+        if touched:
+            src.execute("CREATE TEMP TABLE scope(chat_id INTEGER PRIMARY KEY)")
+            src.executemany("INSERT INTO temp.scope VALUES (?)", [(cid,) for cid in touched])
+            members_by_chat = import_members(src, out, name_for, chat_ids=touched)
+            import_threads(src, out, name_for, members_by_chat, chat_ids=touched)
+            update_message_counts(out, touched)
+            save_import_state(out, high_water)
+        out.execute("COMMIT")
+    except BaseException:
+        out.execute("ROLLBACK")
+        raise
+    finally:
+        out.close()
+    print(f"Updated {len(touched)} chats")
+
+def can_import_incrementally():
+    if not OUT_DB.exists():
+        return False
+    con = sqlite3.connect(str(OUT_DB))
+    try:
+        return con.execute("SELECT 1 FROM sqlite_master WHERE name = 'import_state'").fetchone() is not None
+    finally:
+        con.close()
+
+def main():
+    ap = argparse.ArgumentParser(description="Import input/chat.db into data/processed.db")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only import messages that are new or edited since the last import")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="processes for decoding attributedBody (default: all cores, 1 = serial; "
+                         f"runs with fewer than {DECODE_POOL_MIN} blobs always decode serially)")
+    args = ap.parse_args()
+
+    if not CHAT_DB.exists():
+        print("❌ Missing input/chat.db"); sys.exit(1)
+
+    WORK.mkdir(exist_ok=True)
+    DATA.mkdir(exist_ok=True)
+
+    snapshot_chat_db()
+
+    src = sqlite3.connect(str(WORK_DB))
+    src.row_factory = sqlite3.Row
+
+    if args.incremental and can_import_incrementally():
+        incremental_import(src, workers=args.workers)
+    else:
+        if args.incremental:
+            print("No previous import state found, doing a full import")
+        full_import(src, workers=args.workers)
+
+    src.close()
     print("✅ Done → data/processed.db (includes your sent texts too)")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()